@@ -1,17 +1,26 @@
 import asyncio
 import subprocess
 import sys
-from ollama import chat
+from ollama import chat, Message
 from web import *
+from edit import apply_patch, atomic_write, PatchError
+from speculative import SpeculativeRunner, is_read_only_shell
+from residency import ModelResidency
+from render import FrameRenderer
+from cache import ResponseCache, tool_call_to_dict
+from transcribe import ChunkedTranscriber, format_timestamp
+from vision import describe_images
+from tracing import tracer
+from conversation import Conversation
+from sandbox import ShellPool
 import re
 import threading
 import keyboard
 import getpass
 import platform
-import copy
 import whisper
-import shlex
 import queue
+import time
 
 whisper_model = whisper.load_model("small")
 
@@ -20,9 +29,21 @@ username = getpass.getuser()
 is_generating = False
 abort_generation = False
 do_tool_auth = True
+speculative_tools = True
+speculative_shell = False
+render_fps = 30
 num_agents = 0
 model = "huihui_ai/qwen3-abliterated:8b-v2-q4_K_M"
 image_model = "gemma3:4b-it-qat"
+small_model = None  # Used for the ai command and agents when set, otherwise they use model
+residency = ModelResidency()
+response_cache = None  # ResponseCache when --cache is on
+memory_store = None  # MemoryStore when --memory is on
+memory_top_k = 5
+whisper_workers = 2
+transcript_time_budget = None  # seconds, None = no limit
+image_concurrency = 2
+shell_pool = ShellPool()
 
 # Colors :3
 class Colors:
@@ -80,7 +101,7 @@ tools = [
         "type": "function",
         "function": {
             "name": "edit_file",
-            "description": "Lets you put any content into a file. Use this instead of shell commands to edit files. This is safer and more reliable. Also if the file doesnt exist, this will create it. BUT this cant create directories, so you have to make sure the directory exists.",
+            "description": "Lets you put any content into a file. Use this instead of shell commands to edit files. This is safer and more reliable. Also if the file doesnt exist, this will create it. BUT this cant create directories, so you have to make sure the directory exists. To change only part of an existing file, use patch_file instead, its much faster.",
             "parameters": {
                 "type": "object",
                 "properties": {
@@ -93,6 +114,23 @@ tools = [
             "strict": True
         }
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "patch_file",
+            "description": "Changes part of an existing file without rewriting all of it. Use this for small edits to big files. The patch is either one or more search/replace blocks:\n<<<<<<< SEARCH\nlines currently in the file\n=======\nlines to put there instead\n>>>>>>> REPLACE\nor a unified diff. Copy the search lines from the file as exactly as you can. If the patch doesnt match, nothing is written and you get an error back.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "filename": {"type": "string", "description": "The name of the file to patch. Can be a full path."},
+                    "patch": {"type": "string", "description": "Search/replace blocks or a unified diff."}
+                },
+                "required": ["filename", "patch"],
+                "additionalProperties": False
+            },
+            "strict": True
+        }
+    },
     {
         "type": "function",
         "function": {
@@ -132,58 +170,136 @@ You are an agent, meant to execute tasks for another ai.
 Once you compleated a task, generate a response that includes the task result, and a description of what you did to get the task result.
 """
 
-def describe_image(image_path: str) -> str:
+LLM_OPTIONS = {
+    "num_keep": 4096,
+    "temperature": 0.6,
+    "top_p": 0.95,
+    "presence_penalty": 0.1,
+    "frequency_penalty": 0.3,
+    "penalize_newline": False,
+    "f16_kv": True
+}
+
+def route_model(task):
+    """Picks the model for a kind of work. Cheap work ("ai", "agent") goes to small_model if one is set."""
+    if task == "caption":
+        return image_model
+    if task in ("ai", "agent") and small_model:
+        return small_model
+    return model
+
+def describe_image(image) -> str:
+    """image is a path or the image bytes (see vision.preprocess_image)."""
+    caption_model = route_model("caption")
+    messages = [
+        {
+            'role': 'user',
+            'content': 'Describe this image in detail:',
+            'images': [image]
+        }
+    ]
+
+    key = None
+    if response_cache is not None:
+        key = response_cache.make_key(messages, caption_model)
+        cached = response_cache.get(key)
+        if cached is not None:
+            return cached["text"]
+
+    started = time.perf_counter_ns()
     res = chat(
-        model=image_model,
-        messages=[
-            {
-                'role': 'user',
-                'content': 'Describe this image in detail:',
-                'images': [image_path]
-            }
-        ],
-        stream=True
+        model=caption_model,
+        messages=messages,
+        stream=True,
+        keep_alive=residency.caption_keep_alive
     )
     
     description = ""
     for chunk in res:
         description += chunk['message']['content']
+        if chunk.get('done'):
+            residency.record(caption_model, chunk)
+    tracer.record("describe_image", started, time.perf_counter_ns(), model=caption_model)
+
+    if key is not None:
+        response_cache.put(key, {"text": description})
     
     return description
 
-async def llm_stream(messages, tools=None):
+async def llm_stream(messages, tools=None, model_name=None, stats=None, client=None):
     """
     Streams LLM responses and collects any tool calls.
     Yields (current_response, tool_calls).
+    If stats is a dict, it gets the token counts and timings of the finished response.
+    client is a shared ollama.Client, the module level chat is used without one.
+    With response_cache on, a cached response is replayed instead of asking the model.
     """
-    stream = chat(
-        model=model, 
-        messages=messages, 
-        tools=tools,
-        stream=True,
-        options = {
-            "num_keep": 4096,
-            "temperature": 0.6,
-            "top_p": 0.95,
-            "presence_penalty": 0.1,
-            "frequency_penalty": 0.3,
-            "penalize_newline": False,
-            "f16_kv": True
-        }
-    )
+    model_name = model_name or model
     aggregated = ""
     calls = []
 
-    for chunk in stream:
-        msg = chunk.get('message', {})
-        content = msg.get('content', '')
-        new_calls = msg.get('tool_calls', [])
+    key = None
+    recorded = None
+    if response_cache is not None and not response_cache.bypass:
+        key = response_cache.make_key(messages, model_name, tools, LLM_OPTIONS)
+        cached = response_cache.get(key)
+        if cached is not None:
+            tracer.record("llm.cache_hit", time.perf_counter_ns(), time.perf_counter_ns(), model=model_name)
+            for content, new_calls in cached["chunks"]:
+                aggregated += content
+                calls.extend(Message.ToolCall.model_validate(call) for call in new_calls)
+                yield aggregated, calls
+            if stats is not None:
+                stats.update(cached["stats"])
+                stats["cached"] = 1
+            return
+        recorded = []
+    final_stats = {}
+
+    started = time.perf_counter_ns()
+    first_chunk = None
+    stream = None
+    try:
+        stream = (client.chat if client else chat)(
+            model=model_name, 
+            messages=messages, 
+            tools=tools,
+            stream=True,
+            keep_alive=residency.keep_alive,
+            options=LLM_OPTIONS
+        )
+
+        for chunk in stream:
+            if first_chunk is None:
+                # Everything before the first chunk is model loading + prompt eval
+                first_chunk = time.perf_counter_ns()
+                tracer.record("llm.prompt_eval", started, first_chunk, model=model_name)
+            msg = chunk.get('message', {})
+            content = msg.get('content', '')
+            new_calls = msg.get('tool_calls', [])
+
+            if content:
+                aggregated += content
+            if new_calls:
+                calls.extend(new_calls)
+            if chunk.get('done'):
+                residency.record(model_name, chunk)
+                for stat in ('prompt_eval_count', 'eval_count', 'load_duration', 'prompt_eval_duration', 'eval_duration', 'total_duration'):
+                    final_stats[stat] = chunk.get(stat) or 0
+                if stats is not None:
+                    stats.update(final_stats)
+            if content or new_calls:
+                if recorded is not None:
+                    recorded.append((content, [tool_call_to_dict(call) for call in new_calls]))
+                yield aggregated, calls
+    finally:
+        if stream is not None:
+            stream.close()  # ends the http request when the caller stopped early
+        tracer.record("llm_stream", started, time.perf_counter_ns(), model=model_name, tools=bool(tools), **final_stats)
 
-        if content:
-            aggregated += content
-            yield aggregated, calls
-        if new_calls:
-            calls.extend(new_calls)
+    # Only complete responses get cached, an aborted stream never gets here
+    if recorded is not None:
+        response_cache.put(key, {"chunks": recorded, "stats": final_stats})
 
 async def read_stream(stream_gen):
     response = ""
@@ -216,22 +332,33 @@ async def read_stream(stream_gen):
 
     return response, reasoning, calls
 
-async def display_stream(stream_gen):
+async def display_stream(stream_gen, speculator=None):
     global is_generating, abort_generation
     is_generating = True
     partial = ""
     reasoning = ""
     in_think = False
     calls = []
+    started_calls = 0
     reasoning_tokens = 0
     response_tokens = 0
+    out = FrameRenderer(fps=render_fps).start()
 
     try:
         async for resp, calls in stream_gen:
             if abort_generation:
-                print(f"\n{Colors.ERROR}Generation aborted by user.{Colors.RESET}")
+                out.write("\nGeneration aborted by user.", Colors.ERROR)
+                out.write("\n")
+                if speculator:
+                    speculator.cancel_all()
                 break
 
+            # Start safe tool calls right away, the rest of the output keeps streaming meanwhile
+            if speculator and len(calls) > started_calls:
+                for call in calls[started_calls:]:
+                    speculator.submit(call)
+                started_calls = len(calls)
+
             new_text = resp[len(partial):]
             partial = resp
 
@@ -239,25 +366,25 @@ async def display_stream(stream_gen):
             while output:
                 if not in_think and '<think>' in output:
                     before, _, after = output.partition('<think>')
-                    print(before, end="", flush=True)
+                    out.write(before)
                     response_tokens += len(before.split())
-                    print(f"{Colors.STREAM_LABEL}\n\033[1mThinking...\033[22m{Colors.RESET} ", end="", flush=True)
+                    out.write("\n\033[1mThinking...\033[22m", Colors.STREAM_LABEL)
+                    out.write(" ")
                     output = after
                     in_think = True
 
                 elif in_think and '</think>' in output:
                     reason, _, after = output.partition('</think>')
-                    print(f"{Colors.STREAM_LABEL}{reason}{Colors.RESET}", end="", flush=True)
-                    print(f"{Colors.STREAM_LABEL}\033[1mFinished thinking...\033[22m{Colors.RESET}")
-                    print("\033[F", end="")
+                    out.write(reason, Colors.STREAM_LABEL)
+                    out.write("\033[1mFinished thinking...\033[22m", Colors.STREAM_LABEL)
+                    out.write("\n\033[F")
                     reasoning += reason
                     reasoning_tokens += len(reason.split())
                     output = after
                     in_think = False
 
                 else:
-                    color = Colors.STREAM_LABEL if in_think else Colors.RESET
-                    print(f"{color}{output}{Colors.RESET}", end="", flush=True)
+                    out.write(output, Colors.STREAM_LABEL if in_think else None)
                     if in_think:
                         reasoning += output
                         reasoning_tokens += len(output.split())
@@ -265,6 +392,10 @@ async def display_stream(stream_gen):
                         response_tokens += len(output.split())
                     break
     finally:
+        # Close the stream now, not whenever it gets garbage collected, so llm_stream
+        # ends its http request and span when the user aborts
+        await stream_gen.aclose()
+        out.close()
         is_generating = False
         abort_generation = False
 
@@ -279,94 +410,172 @@ async def display_stream(stream_gen):
 
     return partial, calls, reasoning
 
-async def process_tool_calls(calls, messages):
+def run_shell(cmd, inpt="", cancel=None):
+    """
+    Runs a shell command in the resource limited shell_pool and returns its result dict.
+    Returns None if cancel got set before it finished.
+    """
+    with tracer.span("subprocess", cmd=cmd, speculative=cancel is not None) as span:
+        result = shell_pool.run(cmd, inpt, cancel)
+        span.set(**{key: value for key, value in result.items() if key != "output"})
+    if result["killed"] == "canceled":
+        return None
+    return result
+
+def format_shell_result(cmd, result):
+    """Tool message for a finished command, with its resource usage at the end."""
+    notes = [f"exit code {result['exit_code']}", f"{result['elapsed']}s"]
+    if result["cpu_user"] is not None:
+        notes.append(f"cpu {result['cpu_user'] + result['cpu_system']:.2f}s, max memory {result['max_rss_mb']}MB")
+    if result["killed"]:
+        notes.append(f"killed: {result['killed']}")
+    if result["truncated"]:
+        notes.append("output truncated")
+    return f"Executed '{cmd}', output:\n{result['output']}\n[{', '.join(notes)}]"
+
+def make_speculator():
+    """SpeculativeRunner with the tools that are safe to start before they are authorized."""
+    speculator = SpeculativeRunner()
+    speculator.register("web", lambda args, cancel: asyncio.run(web_search(args["query"], args["num_results"], progress=False)))
+    if speculative_shell:
+        speculator.register("shell", lambda args, cancel: run_shell(args["command"], args.get("input", ""), cancel),
+                            when=lambda args: is_read_only_shell(args.get("command", "")))
+    return speculator
+
+def ask_auth(question, name, args, auth=None):
+    """Asks the user (or the auth policy, when there is one) if a tool may run."""
+    if auth is not None:
+        return auth(name, args)
+    if not do_tool_auth:
+        return True
+    with tracer.span("auth.wait", tool=name):
+        return input(f"{Colors.WARNING}{question} (y/n): {Colors.RESET}").strip().lower() == 'y'
+
+def policy_denied(messages, name):
+    # Without this the model never finds out why nothing happened and just tries again
+    messages.append({
+        "role": "tool",
+        "name": name,
+        "content": json.dumps({"error": "Not allowed by the tool policy."})
+    })
+
+async def process_tool_calls(calls, messages, speculator=None, auth=None):
+    with tracer.span("process_tool_calls", calls=len(calls or [])):
+        return await _process_tool_calls(calls, messages, speculator, auth)
+
+async def _process_tool_calls(calls, messages, speculator=None, auth=None):
     if calls:
         for call in calls:
             name = call.function['name']
             args = call.function['arguments']
-            if name == 'shell':
-                cmd = args['command']
-                inpt = args.get("input", "")
-
-                if do_tool_auth:
-                    choice = input(f"{Colors.WARNING}Run command '{cmd}'? (y/n): {Colors.RESET}")
-                else:
-                    choice = 'y'
-
-                if choice.strip().lower() == 'y':
-                    print(f"{Colors.INFO}Executing: {cmd}{Colors.RESET}")
-                    if platform.system() == 'Windows':
-                        # Windows-style command execution
-                        result = subprocess.run(cmd, text=True, shell=True,
-                                            capture_output=True, input=inpt, encoding="utf-8", errors="replace", timeout=60)
+            with tracer.span(f"tool.{name}"):
+                if name == 'shell':
+                    cmd = args['command']
+                    inpt = args.get("input", "")
+
+                    if ask_auth(f"Run command '{cmd}'?", name, args, auth):
+                        print(f"{Colors.INFO}Executing: {cmd}{Colors.RESET}")
+                        future = speculator.take(call) if speculator else None
+                        result = future.result() if future else None
+                        if result is None:
+                            result = run_shell(cmd, inpt)
+                        if result["killed"]:
+                            print(f"{Colors.ERROR}Command killed: {result['killed']}.{Colors.RESET}")
+                        messages.append({
+                            'role': 'tool',
+                            'name': name,
+                            'content': format_shell_result(cmd, result)
+                        })
+                    else:
+                        if speculator:
+                            speculator.cancel(call)
+                        if auth is not None:
+                            policy_denied(messages, name)
+                        print(f"{Colors.ERROR}Command canceled.{Colors.RESET}")
+
+                if name == 'edit_file':
+                    filename = args['filename']
+                    content = args['content']
+                    print("\033[F", end="")
+                    if ask_auth(f"Write to file '{filename}'?", name, args, auth):
+                        try:
+                            # Text mode newlines like the plain open() this used to be, \n becomes \r\n on Windows
+                            atomic_write(filename, content, newline=None)
+                            print(f"{Colors.INFO}File '{filename}' edited successfully.{Colors.RESET}")
+                            messages.append({
+                                "role": "tool",
+                                "name": name,
+                                "content": json.dumps({"result": "Edited file.", "filename": filename, "content": content})
+                            })
+                        except Exception as e:
+                            print(f"{Colors.ERROR}Error writing to file: {e}{Colors.RESET}")
+                    elif auth is not None:
+                        policy_denied(messages, name)
+
+                if name == 'patch_file':
+                    filename = args['filename']
+                    patch = args['patch']
+                    print("\033[F", end="")
+                    if ask_auth(f"Patch file '{filename}'?", name, args, auth):
+                        try:
+                            removed, added = apply_patch(filename, patch)
+                            print(f"{Colors.INFO}File '{filename}' patched successfully (-{removed} +{added} lines).{Colors.RESET}")
+                            messages.append({
+                                "role": "tool",
+                                "name": name,
+                                "content": json.dumps({"result": "Patched file.", "filename": filename, "lines_removed": removed, "lines_added": added})
+                            })
+                        except (PatchError, OSError, UnicodeDecodeError) as e:
+                            print(f"{Colors.ERROR}Patch rejected: {e}{Colors.RESET}")
+                            messages.append({
+                                "role": "tool",
+                                "name": name,
+                                "content": json.dumps({"error": f"Patch rejected, file was not changed: {e}", "filename": filename})
+                            })
+                    else:
+                        if auth is not None:
+                            policy_denied(messages, name)
+                        print(f"{Colors.ERROR}Patch canceled.{Colors.RESET}")
+
+                if name == "web" and auth is not None and not auth(name, args):
+                    policy_denied(messages, name)
+
+                elif name == "web":
+                    content = args["query"]
+                    num_sites = args["num_results"]
+                    print(f"{Colors.INFO}Searching the web for '{content}'...{Colors.RESET}")
+                    future = speculator.take(call) if speculator else None
+                    if future:
+                        web_search_result = future.result()
                     else:
-                        # Unix-style command execution
-                        cmd_args = shlex.split(cmd)
-                        result = subprocess.run(cmd_args, text=True,
-                                            capture_output=True, input=inpt, encoding="utf-8", errors="replace", timeout=60)
-                    output = (result.stdout or result.stderr).strip()
+                        web_search_result = await web_search(content, num_sites)
                     messages.append({
-                        'role': 'tool',
-                        'name': name,
-                        'content': f"Executed '{cmd}', output:\n{output}"
+                        "role": "tool",
+                        "name": name,
+                        "content": json.dumps({"result": "Searched web.", "query": content, "num_results": num_sites, "result": web_search_result})
                     })
-                else:
-                    print(f"{Colors.ERROR}Command canceled.{Colors.RESET}")
-
-            if name == 'edit_file':
-                filename = args['filename']
-                content = args['content']
-                print("\033[F", end="")
-                if do_tool_auth:
-                    choice = input(f"{Colors.WARNING}Write to file '{filename}'? (y/n): {Colors.RESET}")
-                else:
-                    choice = 'y'
 
-                if choice.strip().lower() == 'y':
-                    try:
-                        with open(filename, 'w') as f:
-                            f.write(content)
-                        print(f"{Colors.INFO}File '{filename}' edited successfully.{Colors.RESET}")
-                        messages.append({
-                            "role": "tool",
-                            "name": name,
-                            "content": json.dumps({"result": "Edited file.", "filename": filename, "content": content})
-                        })
-                    except Exception as e:
-                        print(f"{Colors.ERROR}Error writing to file: {e}{Colors.RESET}")
-
-            if name == "web":
-                content = args["query"]
-                num_sites = args["num_results"]
-                print(f"{Colors.INFO}Searching the web for '{content}'...{Colors.RESET}")
-                web_search_result = await web_search(content, num_sites)
-                messages.append({
-                    "role": "tool",
-                    "name": name,
-                    "content": json.dumps({"result": "Searched web.", "query": content, "num_results": num_sites, "result": web_search_result})
-                })
-
-            if name == "deploy_agent":
-                agents = args["agents"]
-                agents = agents.replace("\\", "\\\\")
-                print(f"{Colors.INFO}Deploying agent '{agents}'...{Colors.RESET}")
-                agents = json.loads(agents)
-                agents_done = 0
-                while agents_done != len(agents):
-                    for agentnum in agents:
-                        agentprompt = agents[agentnum]
-                        q = queue.Queue()
-                        threading.Thread(target=deploy_agent, args=(agentprompt, q), daemon=True).start()
-                        result = q.get()
-
-                        print(f"{Colors.INFO}Agent {agentnum} returned: {result}{Colors.RESET}")
+                if name == "deploy_agent":
+                    agents = args["agents"]
+                    agents = agents.replace("\\", "\\\\")
+                    print(f"{Colors.INFO}Deploying agent '{agents}'...{Colors.RESET}")
+                    agents = json.loads(agents)
+                    agents_done = 0
+                    while agents_done != len(agents):
+                        for agentnum in agents:
+                            agentprompt = agents[agentnum]
+                            q = queue.Queue()
+                            threading.Thread(target=deploy_agent, args=(agentprompt, q), daemon=True).start()
+                            result = q.get()
+
+                            print(f"{Colors.INFO}Agent {agentnum} returned: {result}{Colors.RESET}")
                         
-                        messages.append({
-                            "role": "tool",
-                            "name": name,
-                            "content": json.dumps({"result": "Agent returned result.", "agent number": agentnum, "result": result})
-                        })
-                        agents_done += 1
+                            messages.append({
+                                "role": "tool",
+                                "name": name,
+                                "content": json.dumps({"result": "Agent returned result.", "agent number": agentnum, "result": result})
+                            })
+                            agents_done += 1
     
     return messages
 
@@ -377,21 +586,77 @@ async def agent(task_str):
         {'role': 'user', 'content': task_str}
     ]
 
-    resp, _, calls = await read_stream(llm_stream(messages, tools))
+    agent_model = route_model("agent")
+    resp, _, calls = await read_stream(llm_stream(messages, tools, agent_model))
 
     # now, process tool calls
     if calls:
         messages.append({"role": "assistant", "content": resp})
         messages = await process_tool_calls(calls, messages)
 
-        resp, _, _ = await read_stream(llm_stream(messages, None))
+        resp, _, _ = await read_stream(llm_stream(messages, None, agent_model))
 
     return resp
 
 def deploy_agent(task_str, out_q):
-    response = asyncio.run(agent(task_str))
+    with tracer.span("agent", task=task_str[:100]):
+        response = asyncio.run(agent(task_str))
     out_q.put(response)
 
+async def _forward_stream(stream_gen, on_event=None, should_stop=None):
+    # Passes a llm_stream through while reporting the new text, used by run_turn
+    sent = 0
+    try:
+        async for resp, calls in stream_gen:
+            if should_stop is not None and should_stop():
+                break
+            if on_event is not None and len(resp) > sent:
+                on_event({"type": "content", "text": resp[sent:]})
+                sent = len(resp)
+            yield resp, calls
+    finally:
+        await stream_gen.aclose()
+
+async def run_turn(history, local_tools=None, model_name=None, auth=None, client=None, on_event=None, should_stop=None, gate=None, stats=None):
+    """
+    Runs one user turn without the terminal UI: generate, run tools, repeat until the model stops calling tools.
+    Tool authorization comes from auth instead of y/n prompts. on_event(dict) gets the streamed text and
+    tool activity, gate() is a context manager held around every generation (for scheduling).
+    Appends to history and returns the final response.
+    """
+    with tracer.span("turn", model=model_name):
+        return await _run_turn(history, local_tools, model_name, auth, client, on_event, should_stop, gate, stats)
+
+async def _run_turn(history, local_tools, model_name, auth, client, on_event, should_stop, gate, stats):
+    while True:
+        step_stats = {}
+        stream = _forward_stream(llm_stream(history, local_tools, model_name, step_stats, client), on_event, should_stop)
+        if gate is not None:
+            with gate():
+                response, _, calls = await read_stream(stream)
+        else:
+            response, _, calls = await read_stream(stream)
+
+        if stats is not None:
+            for key, value in step_stats.items():
+                stats[key] = stats.get(key, 0) + value
+
+        if not calls or (should_stop is not None and should_stop()):
+            break
+
+        history.append({"role": "assistant", "content": response})
+        if on_event is not None:
+            for call in calls:
+                on_event({"type": "tool_call", "name": call.function['name'], "arguments": call.function['arguments']})
+        done = len(history)
+        await process_tool_calls(calls, history, auth=auth)
+        if on_event is not None:
+            for message in history[done:]:
+                on_event({"type": "tool_result", "name": message.get("name"), "content": message.get("content")})
+
+    history.append({"role": "assistant", "content": response})
+    return response
+
 async def main():
     global model, tools
     local_tools = tools.copy()
@@ -419,7 +684,12 @@ async def main():
     print(f"{Colors.INFO}Type '?' or 'help' for a list of available user commands.{Colors.RESET}")
     print(f"{Colors.INFO}Type '--file' to upload file(s) for the ai to see.{Colors.RESET}")
     print(f"{Colors.INFO}Type 'ai' to let an ai respond to the ai (autogenerates a prompt based on current converastion).{Colors.RESET}")
-    history = [{"role": "system", "content": SYS_MSG}]
+    # Load the chat model(s) now so the first message doesnt wait for the model to load
+    # The image model is left out, on a GPU that cant hold both it would just push the chat model out
+    residency.warm(model, small_model)
+    transcriber = ChunkedTranscriber(whisper_model, "small", whisper_workers)
+    history = Conversation([{"role": "system", "content": SYS_MSG}])
+    speculator = make_speculator() if speculative_tools else None
     while True:
         user_input = input(f"{Colors.PROMPT}>>> {Colors.RESET}")
 
@@ -438,11 +708,18 @@ async def main():
 
         matches = re.findall(r'--file\s+"([^"]+)"', user_input)
         if matches:
+            # Describe all images together, so they can be deduplicated and run in parallel
+            image_paths = [p for p in matches if p.split('.')[-1] in ('jpg', 'jpeg', 'png', 'gif', 'bmp', 'webp')]
+            image_descs = describe_images(image_paths, describe_image, image_concurrency) if image_paths else {}
+            if image_paths:
+                # Captioning may have pushed the chat model out, get it back while the rest of the files load
+                residency.warm(model, small_model)
+
             for file_path in matches:
                 extension = file_path.split('.')[-1]
                 print(f"{Colors.INFO}MCP has received file: {file_path}, extension: {extension}{Colors.RESET}")
                 if extension in ('jpg', 'jpeg', 'png', 'gif', 'bmp', 'webp'):
-                    image_desc = describe_image(file_path)
+                    image_desc = image_descs[file_path]
 
                     if len(image_desc) > 2000:
                         image_desc = image_desc[:2000]+"..."
@@ -453,15 +730,24 @@ async def main():
                         "content": json.dumps({"content": f"User sent image, auto generated description: {image_desc}", "file_path": file_path})
                     })
                 elif extension in ('mp3', 'wav', 'ogg', 'flac'):
-                    result = whisper.transcribe(whisper_model, file_path)
-
-                    if len(result['text']) > 2000:
-                        result['text'] = result['text'][:2000]+"..."
+                    max_chars = 2000
+                    result = transcriber.transcribe(
+                        file_path, max_chars=max_chars, time_budget=transcript_time_budget,
+                        on_segment=lambda seg: print(f"{Colors.STREAM_LABEL}[{format_timestamp(seg['start'])}] {seg['text']}{Colors.RESET}")
+                    )
+
+                    # Keep the timestamps, so the ai can refer to a specific part of the recording.
+                    # They count towards the 2000 chars too, and the last chunk can overshoot, so cut again here
+                    transcript = "\n".join(f"[{format_timestamp(seg['start'])}] {seg['text']}" for seg in result['segments'])
+                    if len(transcript) > max_chars:
+                        transcript = transcript[:max_chars] + "\n..."
+                    elif result['truncated']:
+                        transcript += "\n..."
 
                     history.append({
                         "role": "tool",
                         "name": "read_file",
-                        "content": json.dumps({"content": f"User sent audio, auto generated transcript: {result['text']}", "file_path": file_path})
+                        "content": json.dumps({"content": f"User sent audio ({format_timestamp(result['duration'])} long), auto generated transcript:\n{transcript}", "file_path": file_path})
                     })
                 else:
                     if os.path.exists(file_path):
@@ -483,18 +769,11 @@ async def main():
             user_input = re.sub(r'--file\s+"[^"]+"', '', user_input).strip()
 
         if user_input == 'ai':
-            copied_history = copy.deepcopy(history)
-            for message in copied_history:
-                if message['role'] == 'assistant':
-                    message['role'] = 'user'
-                elif message['role'] == 'user':
-                    message['role'] = 'assistant'
-
-            # replace the system message with the second system message
-            copied_history[0]['content'] = SECOND_SYS_MSG
+            # same history with user/assistant swapped and the second system message, nothing gets copied
+            ai_history = history.view(swap_roles=True, system=SECOND_SYS_MSG)
 
             # use display_stream to generate a response with this history
-            user_input, _, _ = await display_stream(llm_stream(copied_history, tools))
+            user_input, _, _ = await display_stream(llm_stream(ai_history, tools, route_model("ai")))
 
         if not user_input:
             continue
@@ -511,6 +790,8 @@ async def main():
             print(f"{Colors.INFO} - clear, c, cls : Clear the terminal screen and llms memory")
             print(f"{Colors.INFO} - model, m: Change the base model (default: {model})")
             print(f"{Colors.INFO} - tools, t : Toggle tool execution mode")
+            print(f"{Colors.INFO} - models, ms : Show which models are loaded and how long they took to load")
+            print(f"{Colors.INFO} - cache : Toggle the response cache on/off (only when started with --cache)")
             print(f"{Colors.WARNING} WARNING: YOU CANNOT ENABLE TOOLS AFTER DISABLING THEM ONCE, YOU WILL HAVE TO RESTART THE SCRIPT!")
             print(f"{Colors.INFO} Additional commands:")
             print(f"{Colors.INFO} - export, exp : Export the current conversation history")
@@ -552,30 +833,70 @@ async def main():
             if not new_model.strip():
                 new_model = model
             model = new_model
+            residency.warm(model)
             print(f"{Colors.WARNING}Model changed to: {model}{Colors.RESET}")
             continue
 
+        if user_input.strip() == "cache":
+            if response_cache is None:
+                print(f"{Colors.ERROR}Response cache is off, start ISTA with --cache to use it.{Colors.RESET}")
+            else:
+                response_cache.bypass = not response_cache.bypass
+                print(f"{Colors.WARNING}Response cache {'bypassed' if response_cache.bypass else 'enabled'} ({response_cache.hits} hits, {response_cache.misses} misses).{Colors.RESET}")
+            continue
+
+        if user_input.strip() in ["models", "ms"]:
+            for name, status, load_time, cold_loads, resident in residency.report():
+                load_info = f"last cold load {load_time:.1f}s, {cold_loads} cold load(s)" if load_time else "no cold loads seen"
+                print(f"{Colors.INFO} - {name}: {status}, {'resident' if resident else 'not resident'}, {load_info}{Colors.RESET}")
+            continue
+
         if user_input.strip() in ["clear", "c", "cls"]:
-            history = [{"role": "system", "content": SYS_MSG}]
+            history = Conversation([{"role": "system", "content": SYS_MSG}])
             continue
 
         history += [{"role": "user", "content": user_input}]
+        turn_start = len(history)
+        turn_started = time.perf_counter_ns()
+
+        # Only the memories relevant to this message go into the prompt, they are not kept in history
+        memory_msg = None
+        if memory_store is not None:
+            try:
+                memories = memory_store.search(user_input, memory_top_k)
+            except Exception as e:
+                print(f"{Colors.ERROR}Memory search failed: {e}{Colors.RESET}")
+                memories = []
+            if memories:
+                memory_msg = {"role": "system", "content": "Relevant memories from earlier conversations:\n" + "\n".join(f"- {m['text']}" for _, m in memories)}
 
         # Start streaming
         tool_calls = ["i put one string here cuz i wanna lower the lines of code so i dont use a startup variable"]
         while tool_calls:
-            partial, tool_calls, reasoning = await display_stream(llm_stream(history, local_tools))
+            prompt = history.view(after_system=[memory_msg]) if memory_msg else history
+            partial, tool_calls, reasoning = await display_stream(llm_stream(prompt, local_tools), speculator)
             
             # Handle any tool calls
             if tool_calls:
                 history.append({"role": "assistant", "content": partial})
-                history = await process_tool_calls(tool_calls, history)
+                history = await process_tool_calls(tool_calls, history, speculator)
+            if speculator:
+                # Drop anything that was started but never used
+                speculator.cancel_all()
         
         history.append({"role": "assistant", "content": partial})
+        tracer.record("turn", turn_started, time.perf_counter_ns(), messages=len(history))
+
+        if memory_store is not None:
+            memory_store.add_async([f"User: {user_input}\nAssistant: {partial}"], "turn")
+            tool_results = [m["content"] for m in history[turn_start:] if m["role"] == "tool"]
+            if tool_results:
+                memory_store.add_async(tool_results, "tool")
 
 if __name__ == '__main__':
-    # Start abort listener thread
-    threading.Thread(target=listen_for_abort, daemon=True).start()
+    # Start abort listener thread, server and batch mode have no terminal to listen on
+    if '--serve' not in sys.argv and '--batch' not in sys.argv:
+        threading.Thread(target=listen_for_abort, daemon=True).start()
 
     if '--model' in subprocess.list2cmdline(sys.argv):
         model_index = sys.argv.index('--model') + 1
@@ -583,6 +904,50 @@ if __name__ == '__main__':
             model = sys.argv[model_index]
             print(f"{Colors.WARNING}Using model: {model}{Colors.RESET}")
 
+    if '--small-model' in sys.argv:
+        small_model_index = sys.argv.index('--small-model') + 1
+        if small_model_index < len(sys.argv):
+            small_model = sys.argv[small_model_index]
+            print(f"{Colors.WARNING}Using small model: {small_model}{Colors.RESET}")
+
+    if '--keep-alive' in sys.argv:
+        keep_alive_index = sys.argv.index('--keep-alive') + 1
+        if keep_alive_index < len(sys.argv):
+            residency.keep_alive = sys.argv[keep_alive_index]
+
+    if '--cache' in sys.argv:
+        cache_index = sys.argv.index('--cache') + 1
+        cache_dir = sys.argv[cache_index] if cache_index < len(sys.argv) and not sys.argv[cache_index].startswith('--') else ".ista_cache"
+        cache_size = int(sys.argv[sys.argv.index('--cache-size') + 1]) if '--cache-size' in sys.argv else 64
+        response_cache = ResponseCache(cache_dir, cache_size * 1024 * 1024)
+        print(f"{Colors.WARNING}Response cache on ({cache_dir}, {cache_size}MB). Identical requests will be answered from the cache.{Colors.RESET}")
+
+    if '--memory' in sys.argv:
+        from memory import MemoryStore
+        memory_index = sys.argv.index('--memory') + 1
+        memory_dir = sys.argv[memory_index] if memory_index < len(sys.argv) and not sys.argv[memory_index].startswith('--') else ".ista_memory"
+        embed_model = sys.argv[sys.argv.index('--embed-model') + 1] if '--embed-model' in sys.argv else "nomic-embed-text"
+        memory_store = MemoryStore(memory_dir, embed_model, on_error=lambda e: print(f"{Colors.ERROR}Could not save memory: {e}{Colors.RESET}"))
+        print(f"{Colors.WARNING}Long-term memory on ({memory_dir}, {len(memory_store)} memories).{Colors.RESET}")
+
+    if '--trace' in sys.argv:
+        import atexit
+        trace_path = sys.argv[sys.argv.index('--trace') + 1]
+        tracer.enabled = True
+        atexit.register(lambda: print(f"{Colors.INFO}Wrote {tracer.export(trace_path)} trace events to {trace_path}.{Colors.RESET}"))
+
+    if '--shell-limits' in sys.argv:
+        shell_pool = ShellPool.from_string(sys.argv[sys.argv.index('--shell-limits') + 1])
+
+    if '--whisper-workers' in sys.argv:
+        whisper_workers = int(sys.argv[sys.argv.index('--whisper-workers') + 1])
+
+    if '--transcript-time' in sys.argv:
+        transcript_time_budget = float(sys.argv[sys.argv.index('--transcript-time') + 1])
+
+    if '--image-concurrency' in sys.argv:
+        image_concurrency = int(sys.argv[sys.argv.index('--image-concurrency') + 1])
+
     if '--no-tools' in subprocess.list2cmdline(sys.argv):
         tools = None
         print(f"{Colors.WARNING}Tools disabled. AI will not execute any tools.{Colors.RESET}")
@@ -591,12 +956,63 @@ if __name__ == '__main__':
         print(f"{Colors.WARNING}Authentication disabled. The AI can now execute tools without authentication.{Colors.RESET}")
         do_tool_auth = False
 
+    if '--no-speculation' in sys.argv:
+        speculative_tools = False
+
+    if '--speculate-shell' in sys.argv:
+        print(f"{Colors.WARNING}Read-only shell commands will start before they are authorized. Results are discarded if you deny them.{Colors.RESET}")
+        speculative_shell = True
+
+    if '--fps' in sys.argv:
+        fps_index = sys.argv.index('--fps') + 1
+        if fps_index < len(sys.argv):
+            render_fps = int(sys.argv[fps_index])
+
     if '--agents' in sys.argv:
         print(f"{Colors.WARNING}WARNING: THIS FEATURE IS HIGHLY EXPERIMENTAL! USE AT YOUR OWN RISK!!!{Colors.RESET}")
         agents_index = sys.argv.index('--agents') + 1
         num_agents = int(sys.argv[agents_index])
         print(f"{Colors.WARNING}Allowing ai to deploy {num_agents} agents.{Colors.RESET}")
 
+    if '--batch' in sys.argv:
+        from ollama import Client
+        from policy import ToolPolicy
+        from batch import run_batch
+
+        in_path = sys.argv[sys.argv.index('--batch') + 1]
+        out_path = sys.argv[sys.argv.index('--out') + 1] if '--out' in sys.argv else os.path.splitext(in_path)[0] + ".results.jsonl"
+        concurrency = int(sys.argv[sys.argv.index('--concurrency') + 1]) if '--concurrency' in sys.argv else 4
+        backend = sys.argv[sys.argv.index('--backend') + 1] if '--backend' in sys.argv else None
+        policy = ToolPolicy.from_string(sys.argv[sys.argv.index('--policy') + 1]) if '--policy' in sys.argv else ToolPolicy()
+
+        def print_result(record):
+            color = Colors.INFO if record["status"] == "ok" else Colors.ERROR
+            print(f"{color}Task {record['id']}: {record['status']} in {record['elapsed']}s ({record['completion_tokens']} tokens, {record['tool_calls']} tool calls){Colors.RESET}")
+
+        print(f"{Colors.INFO}Running batch {in_path} -> {out_path} ({concurrency} at a time, {policy}).{Colors.RESET}")
+        finished, failed, skipped = run_batch(in_path, out_path, run_turn, tools, SYS_MSG, model, concurrency,
+                                              auth=policy, client=Client(host=backend), on_result=print_result)
+        print(f"{Colors.INFO}Batch done: {finished} ok, {failed} failed, {skipped} already done.{Colors.RESET}")
+        sys.exit(1 if failed else 0)
+
+    if '--serve' in sys.argv:
+        from ollama import Client
+        from policy import ToolPolicy
+        from server import serve
+
+        serve_index = sys.argv.index('--serve') + 1
+        port = int(sys.argv[serve_index]) if serve_index < len(sys.argv) and sys.argv[serve_index].isdigit() else 8765
+        backend = sys.argv[sys.argv.index('--backend') + 1] if '--backend' in sys.argv else None
+        slots = int(sys.argv[sys.argv.index('--slots') + 1]) if '--slots' in sys.argv else 1
+        policy = ToolPolicy.from_string(sys.argv[sys.argv.index('--policy') + 1]) if '--policy' in sys.argv else ToolPolicy()
+
+        print(f"{Colors.INFO}Serving ISTA on http://127.0.0.1:{port} ({slots} model slot(s), {policy}).{Colors.RESET}")
+        try:
+            serve(run_turn, tools, SYS_MSG, model, port=port, client=Client(host=backend), auth=policy, slots=slots)
+        except KeyboardInterrupt:
+            print(f"\n{Colors.INFO}Goodbye!{Colors.RESET}")
+        sys.exit(0)
+
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
@@ -0,0 +1,98 @@
+# -- file: batch.py --
+# -- libraries --
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import asyncio
+import json
+import os
+import time
+
+def load_tasks(path):
+    """Reads tasks from a JSONL file. Each line is {"prompt": ..., "id": optional, "model": optional}."""
+    tasks = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            task = json.loads(line)
+            if not isinstance(task, dict):
+                task = {"prompt": task}  # a plain string is the prompt, anything else fails in run_task
+            task["id"] = str(task.get("id", line_number))
+            tasks.append(task)
+    return tasks
+
+def completed_ids(out_path):
+    """Ids that already finished successfully in a previous run, so they can be skipped."""
+    done = set()
+    if not os.path.exists(out_path):
+        return done
+    with open(out_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # half written line from a crash
+            if record.get("status") == "ok":
+                done.add(str(record.get("id")))
+    return done
+
+def run_task(task, turn_fn, tools, system_msg, model_name, auth=None, client=None):
+    history = []
+    stats = {}
+    record = {"id": task["id"], "model": task.get("model") or model_name}
+    start = time.perf_counter()
+    try:
+        # Inside the try, a task without a prompt is just one failed task, not a crashed batch
+        if not isinstance(task.get("prompt"), str):
+            raise ValueError("Task has no \"prompt\" string.")
+        history += [
+            {"role": "system", "content": system_msg},
+            {"role": "user", "content": task["prompt"]}
+        ]
+        record["response"] = asyncio.run(turn_fn(history, tools, model_name=record["model"], auth=auth, client=client, stats=stats))
+        record["status"] = "ok"
+    except Exception as e:
+        record["status"] = "error"
+        record["error"] = str(e)
+    record["elapsed"] = round(time.perf_counter() - start, 3)
+    record["prompt_tokens"] = stats.get("prompt_eval_count", 0)
+    record["completion_tokens"] = stats.get("eval_count", 0)
+    record["tool_calls"] = sum(1 for message in history if message["role"] == "tool")
+    return record
+
+def run_batch(in_path, out_path, turn_fn, tools, system_msg, model_name, concurrency=4, auth=None, client=None, on_result=None):
+    """
+    Runs every task in in_path through turn_fn, concurrency at a time, and appends one JSON line per
+    task to out_path as soon as it finishes. Tasks already in out_path with status "ok" are skipped,
+    so a crashed batch can just be started again. Returns (finished, failed, skipped).
+    """
+    tasks = load_tasks(in_path)
+    done = completed_ids(out_path)
+    pending = [task for task in tasks if task["id"] not in done]
+    finished = failed = 0
+
+    # Make sure a half written line from a crash doesnt get glued to the first new record
+    if os.path.exists(out_path) and os.path.getsize(out_path):
+        with open(out_path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            needs_newline = f.read(1) != b"\n"
+    else:
+        needs_newline = False
+
+    with open(out_path, 'a', encoding='utf-8') as out, ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        if needs_newline:
+            out.write("\n")
+        futures = [pool.submit(run_task, task, turn_fn, tools, system_msg, model_name, auth, client) for task in pending]
+        for future in as_completed(futures):
+            record = future.result()
+            out.write(json.dumps(record, default=str) + "\n")
+            out.flush()
+            os.fsync(out.fileno())
+            if record["status"] == "ok":
+                finished += 1
+            else:
+                failed += 1
+            if on_result is not None:
+                on_result(record)
+
+    return finished, failed, len(tasks) - len(pending)
@@ -0,0 +1,131 @@
+# -- file: cache.py --
+# -- libraries --
+from collections import OrderedDict
+from edit import atomic_write
+import hashlib
+import json
+import os
+import threading
+
+def _normalize_image(image):
+    # Paths get their size + mtime hashed in, so a changed file doesnt hit an old entry
+    if isinstance(image, (bytes, bytearray)):
+        return hashlib.sha256(image).hexdigest()
+    image = str(image)
+    if os.path.exists(image):
+        stat = os.stat(image)
+        return [os.path.abspath(image), stat.st_size, stat.st_mtime_ns]
+    return image
+
+def _normalize_message(message):
+    normalized = {
+        "role": message.get("role"),
+        "content": (message.get("content") or "").strip(),
+    }
+    if message.get("name"):
+        normalized["name"] = message.get("name")
+    if message.get("images"):
+        normalized["images"] = [_normalize_image(image) for image in message.get("images")]
+    return normalized
+
+def tool_call_to_dict(call):
+    """Turns an ollama ToolCall into plain JSON."""
+    if hasattr(call, "model_dump"):
+        return call.model_dump(exclude_none=True)
+    return json.loads(json.dumps(call, default=lambda o: o.__dict__))
+
+class ResponseCache:
+    """
+    Exact-match cache for finished model responses, stored as one JSON file per entry.
+    Least recently used entries are deleted once the cache grows past max_bytes.
+    """
+
+    def __init__(self, directory=".ista_cache", max_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.bypass = False
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index = OrderedDict()  # key -> size in bytes, oldest first
+        self._size = 0
+
+        os.makedirs(directory, exist_ok=True)
+        entries = []
+        for filename in os.listdir(directory):
+            if filename.endswith(".json"):
+                stat = os.stat(os.path.join(directory, filename))
+                entries.append((stat.st_mtime, filename[:-5], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._size += size
+
+    @staticmethod
+    def make_key(messages, model_name, tools=None, options=None):
+        """Hash of everything that changes what the model would answer."""
+        payload = {
+            "model": model_name,
+            "messages": [_normalize_message(message) for message in messages],
+            "tools": tools,
+            "options": options,
+        }
+        data = json.dumps(payload, sort_keys=True, default=str, ensure_ascii=False)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, key):
+        if self.bypass:
+            return None
+        with self._lock:
+            if key not in self._index:
+                self.misses += 1
+                return None
+            self._index.move_to_end(key)
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            os.utime(self._path(key))
+        except (OSError, json.JSONDecodeError):
+            with self._lock:
+                self._size -= self._index.pop(key, 0)
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        if self.bypass:
+            return
+        data = json.dumps(entry, ensure_ascii=False)
+        size = len(data.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        atomic_write(self._path(key), data)
+
+        with self._lock:
+            self._size += size - self._index.pop(key, 0)
+            self._index[key] = size
+            evicted = []
+            while self._size > self.max_bytes and self._index:
+                old_key, old_size = self._index.popitem(last=False)
+                self._size -= old_size
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.remove(self._path(old_key))
+            except OSError:
+                pass
+
+    def clear(self):
+        with self._lock:
+            keys = list(self._index)
+            self._index.clear()
+            self._size = 0
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
@@ -0,0 +1,115 @@
+# -- file: conversation.py --
+# -- libraries --
+from collections.abc import Sequence
+import sys
+
+_SWAPPED_ROLES = {"user": "assistant", "assistant": "user"}
+
+class Record:
+    """One message. Slots instead of a dict, and the role/name strings are interned."""
+    __slots__ = ("role", "content", "name", "images", "tool_calls")
+
+    def __init__(self, role, content="", name=None, images=None, tool_calls=None):
+        self.role = sys.intern(role)
+        self.content = content
+        self.name = sys.intern(name) if name else None
+        self.images = images
+        self.tool_calls = tool_calls
+
+    @classmethod
+    def from_dict(cls, message):
+        return cls(message["role"], message.get("content", ""), message.get("name"), message.get("images"), message.get("tool_calls"))
+
+    def to_dict(self, role=None, content=None):
+        """Builds the message dict for the backend. Strings are shared, not copied."""
+        message = {"role": role or self.role, "content": self.content if content is None else content}
+        if self.name:
+            message["name"] = self.name
+        if self.images:
+            message["images"] = self.images
+        if self.tool_calls:
+            message["tool_calls"] = self.tool_calls
+        return message
+
+class ConversationView(Sequence):
+    """
+    Read-only view of a Conversation. Nothing is copied when the view is made,
+    message dicts are only built one at a time while the view is iterated (when the payload gets serialized).
+    """
+
+    def __init__(self, conversation, swap_roles=False, system=None, window=None, after_system=None):
+        self._conversation = conversation
+        self._swap_roles = swap_roles
+        self._system = system
+        self._window = window
+        self._after_system = after_system or []
+
+    def _indexes(self):
+        total = len(self._conversation._records)
+        if self._window is None or total <= self._window + 1:
+            return range(total)
+        # The system prompt always stays, the window is the newest messages after it
+        return [0] + list(range(total - self._window, total))
+
+    def _message(self, index):
+        record = self._conversation._records[index]
+        role = _SWAPPED_ROLES.get(record.role, record.role) if self._swap_roles else record.role
+        content = self._system if index == 0 and record.role == "system" and self._system is not None else None
+        return record.to_dict(role, content)
+
+    def __iter__(self):
+        indexes = self._indexes()
+        for position, index in enumerate(indexes):
+            yield self._message(index)
+            if position == 0 and self._after_system:
+                yield from self._after_system
+
+    def __len__(self):
+        return len(self._indexes()) + len(self._after_system)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        return list(self)[index] if self._after_system else self._message(self._indexes()[index])
+
+class Conversation(Sequence):
+    """
+    Conversation history stored as compact Records.
+    Behaves like the list of message dicts it replaces (append, +=, iteration, indexing),
+    and view() gives role-swapped/system-replaced/windowed versions without copying anything.
+    """
+
+    def __init__(self, messages=()):
+        self._records = []
+        self.extend(messages)
+
+    def append(self, message):
+        self._records.append(message if isinstance(message, Record) else Record.from_dict(message))
+
+    def extend(self, messages):
+        for message in messages:
+            self.append(message)
+
+    def __iadd__(self, messages):
+        self.extend(messages)
+        return self
+
+    def __len__(self):
+        return len(self._records)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [record.to_dict() for record in self._records[index]]
+        return self._records[index].to_dict()
+
+    def __iter__(self):
+        for record in self._records:
+            yield record.to_dict()
+
+    def view(self, swap_roles=False, system=None, window=None, after_system=None):
+        """
+        swap_roles swaps user/assistant, system replaces the system prompt, window keeps only
+        the newest window messages (plus the system prompt) and after_system inserts extra
+        messages right after the system prompt.
+        """
+        return ConversationView(self, swap_roles, system, window, after_system)
@@ -0,0 +1,219 @@
+# -- file: edit.py --
+# -- libraries --
+import difflib
+import os
+import re
+import tempfile
+
+# How similar a block has to be to the file to still count as a match when
+# the model didnt copy the original lines perfectly
+FUZZY_THRESHOLD = 0.85
+# A fuzzy match is rejected when another spot in the file scores within this much of it
+FUZZY_MARGIN = 0.05
+# Short blocks look alike everywhere ("return a" vs "return c"), they have to match exactly
+FUZZY_MIN_CHARS = 30
+
+_HUNK_HEADER = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+\d+(?:,(\d+))? @@')
+# Only real line breaks, str.splitlines() would also split on \f, \v, \x1c-\x1e, \x85, \u2028 and \u2029
+_NEWLINE = re.compile(r'\r?\n')
+_SEARCH_BLOCK = re.compile(
+    r'^<{5,}\s*SEARCH[^\n]*\n(.*?)^={5,}[^\n]*\n(.*?)^>{5,}\s*REPLACE[^\n]*$',
+    re.DOTALL | re.MULTILINE
+)
+
+class PatchError(Exception):
+    """Raised when a patch cant be applied. The file is left untouched."""
+    pass
+
+def split_lines(text):
+    """Like str.splitlines(), but only breaks on \\n and \\r\\n."""
+    lines = _NEWLINE.split(text)
+    if lines[-1] == "":
+        lines.pop()
+    return lines
+
+def _umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+def atomic_write(filename, content, newline=''):
+    """
+    Write content to filename through a temp file + rename, so the file is never half written.
+    newline works like open()'s, the default '' writes the line endings in content as they are.
+    """
+    # Write through symlinks instead of replacing the link itself
+    filename = os.path.realpath(filename)
+    directory = os.path.dirname(filename)
+    fd, tmp_path = tempfile.mkstemp(prefix=".ista-", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8', newline=newline) as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        # Keep the permissions of the file we are replacing, new files get the
+        # same permissions open(..., 'w') would give them (mkstemp makes them 0600)
+        if os.path.exists(filename):
+            os.chmod(tmp_path, os.stat(filename).st_mode & 0o7777)
+        else:
+            os.chmod(tmp_path, 0o666 & ~_umask())
+        os.replace(tmp_path, filename)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def parse_patch(patch):
+    """
+    Parses a patch into a list of (search_lines, replace_lines, hint) blocks.
+    Accepts search/replace blocks or a unified diff. hint is the 0-based line
+    the change is expected at, or None.
+    """
+    blocks = []
+
+    for search, replace in _SEARCH_BLOCK.findall(patch):
+        blocks.append((split_lines(search), split_lines(replace), None))
+    if blocks:
+        return blocks
+
+    # Hunk bodies end after the number of lines their @@ header says. "---"/"+++" file headers
+    # only count outside of a hunk, inside one "+++i;" is just an added "++i;".
+    search, replace, hint = None, None, None
+    old_left = new_left = 0
+    for line in split_lines(patch):
+        header = _HUNK_HEADER.match(line)
+        if header:
+            if search is not None:
+                blocks.append((search, replace, hint))
+            search, replace = [], []
+            start = int(header.group(1))
+            old_left = 1 if header.group(2) is None else int(header.group(2))
+            new_left = 1 if header.group(3) is None else int(header.group(3))
+            # A pure insertion (old count 0) names the line to insert after, not the first changed line
+            hint = start if old_left == 0 else max(start - 1, 0)
+            continue
+        if search is None or line.startswith('\\'):
+            continue
+        if old_left <= 0 and new_left <= 0:
+            # Past the end of the hunk. Keep going if the model just miscounted,
+            # stop at file headers, "diff --git" lines and anything else
+            if not line.startswith((' ', '-', '+')) or line.startswith(('---', '+++')):
+                blocks.append((search, replace, hint))
+                search = None
+                continue
+        if line.startswith('-'):
+            search.append(line[1:])
+            old_left -= 1
+        elif line.startswith('+'):
+            replace.append(line[1:])
+            new_left -= 1
+        else:
+            # Context line, some models drop the leading space on empty lines
+            line = line[1:] if line.startswith(' ') else line
+            search.append(line)
+            replace.append(line)
+            old_left -= 1
+            new_left -= 1
+    if search is not None:
+        blocks.append((search, replace, hint))
+
+    if not blocks:
+        raise PatchError("No search/replace blocks or unified diff hunks found in patch.")
+    return blocks
+
+def _closest(positions, hint):
+    if len(positions) == 1:
+        return positions[0]
+    if hint is None:
+        raise PatchError(f"Search block matches {len(positions)} places, add more context.")
+    return min(positions, key=lambda pos: abs(pos - hint))
+
+def find_block(lines, search, hint=None):
+    """Returns the index where search starts in lines, matching exactly first and fuzzier after that."""
+    size = len(search)
+    if size == 0:
+        if not lines:
+            return 0
+        if hint is None:
+            raise PatchError("Empty search block, dont know where to put the change.")
+        return min(hint, len(lines))
+    if size > len(lines):
+        raise PatchError("Search block is longer than the file.")
+
+    # 1. exact, 2. ignoring trailing whitespace, 3. ignoring all surrounding whitespace
+    for normalize in (lambda s: s, str.rstrip, str.strip):
+        wanted = [normalize(line) for line in search]
+        first = wanted[0]
+        positions = [
+            i for i in range(len(lines) - size + 1)
+            if normalize(lines[i]) == first and [normalize(line) for line in lines[i:i + size]] == wanted
+        ]
+        if positions:
+            return _closest(positions, hint)
+
+    # 4. fuzzy, for when the model misremembered a few characters
+    wanted = "\n".join(line.strip() for line in search)
+    if len(wanted) >= FUZZY_MIN_CHARS:
+        candidates = []  # (ratio, index) of every window that comes close
+        matcher = difflib.SequenceMatcher(autojunk=False)
+        matcher.set_seq2(wanted)
+        cutoff = FUZZY_THRESHOLD - FUZZY_MARGIN
+        for i in range(len(lines) - size + 1):
+            matcher.set_seq1("\n".join(line.strip() for line in lines[i:i + size]))
+            if matcher.real_quick_ratio() < cutoff or matcher.quick_ratio() < cutoff:
+                continue
+            ratio = matcher.ratio()
+            if ratio >= cutoff:
+                candidates.append((ratio, i))
+        if candidates:
+            best_ratio, best = max(candidates)
+            # Windows overlapping the best one are just the same spot shifted a line, they dont count
+            rivals = [i for ratio, i in candidates if abs(i - best) >= size and ratio >= best_ratio - FUZZY_MARGIN]
+            if best_ratio >= FUZZY_THRESHOLD:
+                if rivals:
+                    raise PatchError(f"Search block is not in the file and looks like {len(rivals) + 1} places, add more context.")
+                return best
+
+    preview = "\n".join(search[:3])
+    raise PatchError(f"Could not find the lines to replace:\n{preview}")
+
+def apply_patch_text(text, patch):
+    """
+    Applies a patch to text. Returns (new_text, lines_removed, lines_added).
+    Raises PatchError if any block doesnt match.
+    """
+    newline = "\r\n" if "\r\n" in text else "\n"
+    trailing_newline = text.endswith(("\n", "\r\n")) or not text
+    lines = split_lines(text)
+    offset = removed = added = 0
+
+    for search, replace, hint in parse_patch(patch):
+        start = find_block(lines, search, None if hint is None else hint + offset)
+        # Count against the real file lines so context lines dont show up as changes
+        for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, lines[start:start + len(search)], replace).get_opcodes():
+            if tag != 'equal':
+                removed += i2 - i1
+                added += j2 - j1
+        lines[start:start + len(search)] = replace
+        offset += len(replace) - len(search)
+
+    result = newline.join(lines)
+    if trailing_newline and lines:
+        result += newline
+    return result, removed, added
+
+def apply_patch(filename, patch):
+    """Patches a file in place. Returns (lines_removed, lines_added). Nothing is written if the patch fails."""
+    if os.path.exists(filename):
+        with open(filename, 'r', encoding='utf-8', newline='') as f:
+            original = f.read()
+    else:
+        original = ""
+
+    patched, removed, added = apply_patch_text(original, patch)
+
+    if patched == original:
+        raise PatchError("Patch did not change anything.")
+
+    atomic_write(filename, patched)
+    return removed, added
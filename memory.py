@@ -0,0 +1,160 @@
+# -- file: memory.py --
+# -- libraries --
+from concurrent.futures import ThreadPoolExecutor
+from ollama import embed
+import numpy as np
+import json
+from edit import atomic_write
+import os
+import sys
+import threading
+import time
+
+# Longest text that gets embedded/stored per memory
+MAX_MEMORY_CHARS = 2000
+
+class MemoryStore:
+    """
+    Long-term memory across sessions.
+    Texts are embedded with the model server and the unit vectors are kept in a memory-mapped
+    float32 matrix (vectors.f32), one row per memory. The texts themselves go into a JSONL
+    sidecar (meta.jsonl), which is only read for the rows a search returns.
+    """
+
+    def __init__(self, directory=".ista_memory", embed_model="nomic-embed-text", client=None, on_error=None):
+        self.directory = directory
+        self.embed_model = embed_model
+        self.client = client
+        # Called with the exception when a background add fails, so memories dont get lost silently
+        self.on_error = on_error or (lambda e: print(f"Could not save memory: {e}", file=sys.stderr))
+        self._vectors_path = os.path.join(directory, "vectors.f32")
+        self._meta_path = os.path.join(directory, "meta.jsonl")
+        self._header_path = os.path.join(directory, "header.json")
+        self._lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ista-memory")
+        self._vectors = None
+        self._capacity = 0
+        self.dim = None
+        self.count = 0
+
+        os.makedirs(directory, exist_ok=True)
+        offsets = []
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path, 'rb') as f:
+                position = 0
+                for line in f:
+                    if line.endswith(b"\n"):
+                        offsets.append(position)
+                    position += len(line)
+        self._offsets = np.array(offsets, dtype=np.int64)
+
+        if os.path.exists(self._header_path):
+            with open(self._header_path, 'r', encoding='utf-8') as f:
+                header = json.load(f)
+            self.dim = header["dim"]
+            # The header is written last, so after a crash it is never ahead of the other files
+            self.count = min(header["count"], len(self._offsets))
+            if len(self._offsets) > self.count:
+                # Drop texts whose vectors never made it to disk
+                with open(self._meta_path, 'r+b') as f:
+                    f.truncate(int(self._offsets[self.count]))
+            self._offsets = self._offsets[:self.count]
+            self._capacity = os.path.getsize(self._vectors_path) // (self.dim * 4)
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode='r+', shape=(self._capacity, self.dim))
+        elif len(self._offsets):
+            # Crashed before the very first header got written
+            open(self._meta_path, 'wb').close()
+            self._offsets = self._offsets[:0]
+
+        # Rows after this one are from the current session, they are still in the history anyway
+        self.session_start = self.count
+
+    def __len__(self):
+        return self.count
+
+    def _embed(self, texts):
+        res = (self.client.embed if self.client else embed)(model=self.embed_model, input=texts)
+        vectors = np.asarray(res["embeddings"], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return vectors / norms
+
+    def _ensure_capacity(self, rows):
+        if rows <= self._capacity:
+            return
+        capacity = max(rows, self._capacity * 2, 1024)
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+        with open(self._vectors_path, 'ab') as f:
+            f.truncate(capacity * self.dim * 4)
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode='r+', shape=(capacity, self.dim))
+        self._capacity = capacity
+
+    def add(self, texts, kind="turn"):
+        """Embeds and stores texts. Blocks until they are written, see add_async."""
+        texts = [text[:MAX_MEMORY_CHARS] for text in texts if text and text.strip()]
+        if not texts:
+            return
+        vectors = self._embed(texts)
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding size changed from {self.dim} to {vectors.shape[1]}, use a new memory directory for a new embed model.")
+
+            start = self.count
+            self._ensure_capacity(start + len(texts))
+
+            with open(self._meta_path, 'ab') as f:
+                position = f.tell()
+                offsets = []
+                for text in texts:
+                    line = (json.dumps({"text": text, "kind": kind, "time": time.time()}, ensure_ascii=False) + "\n").encode("utf-8")
+                    offsets.append(position)
+                    f.write(line)
+                    position += len(line)
+
+            self._vectors[start:start + len(texts)] = vectors
+            self._vectors.flush()
+            self._offsets = np.concatenate([self._offsets, np.array(offsets, dtype=np.int64)])
+            self.count = start + len(texts)
+
+            # Atomic, a half written header would keep the store from loading at all
+            atomic_write(self._header_path, json.dumps({"dim": self.dim, "count": self.count, "embed_model": self.embed_model}))
+
+    def add_async(self, texts, kind="turn"):
+        """Same as add, but in the background so the conversation doesnt wait for the embedding. Errors go to on_error."""
+        future = self._writer.submit(self.add, texts, kind)
+        future.add_done_callback(self._check)
+        return future
+
+    def _check(self, future):
+        if not future.cancelled() and future.exception() is not None:
+            self.on_error(future.exception())
+
+    def search(self, query, k=5, min_score=0.3):
+        """
+        Returns up to k (score, memory) pairs most similar to query, best first.
+        Only memories from earlier sessions are searched.
+        """
+        if not self.session_start or not query.strip():
+            return []
+        q = self._embed([query[:MAX_MEMORY_CHARS]])[0]
+
+        with self._lock:
+            if q.shape[0] != self.dim:
+                return []
+            scores = self._vectors[:self.session_start] @ q
+            k = min(k, self.session_start)
+            top = np.argpartition(scores, -k)[-k:]
+            top = top[np.argsort(scores[top])[::-1]]
+            hits = [(float(scores[i]), int(self._offsets[i])) for i in top if scores[i] >= min_score]
+
+        results = []
+        with open(self._meta_path, 'rb') as f:
+            for score, offset in hits:
+                f.seek(offset)
+                results.append((score, json.loads(f.readline())))
+        return results
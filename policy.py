@@ -0,0 +1,45 @@
+# -- file: policy.py --
+# -- libraries --
+from speculative import is_read_only_shell
+
+class ToolPolicy:
+    """
+    Authorizes tool calls without asking anyone, for when nobody is sitting at the terminal (server, batch).
+    shell is "all", "read-only" or "none", files and web are True/False.
+    """
+
+    def __init__(self, shell="read-only", files=False, web=True):
+        if shell not in ("all", "read-only", "none"):
+            raise ValueError(f"Unknown shell policy: {shell}")
+        self.shell = shell
+        self.files = files
+        self.web = web
+
+    @classmethod
+    def from_string(cls, spec):
+        """Parses something like "shell=read-only,files=yes,web=no"."""
+        options = {}
+        for part in filter(None, (p.strip() for p in spec.split(","))):
+            key, _, value = part.partition("=")
+            key, value = key.strip(), value.strip().lower()
+            if key == "shell":
+                options["shell"] = value
+            elif key in ("files", "web"):
+                options[key] = value in ("1", "y", "yes", "true", "on")
+            else:
+                raise ValueError(f"Unknown tool policy option: {key}")
+        return cls(**options)
+
+    def __call__(self, name, args):
+        if name == "shell":
+            if self.shell == "all":
+                return True
+            return self.shell == "read-only" and is_read_only_shell(args.get("command", ""))
+        if name in ("edit_file", "patch_file"):
+            return self.files
+        if name == "web":
+            return self.web
+        return False
+
+    def __repr__(self):
+        return f"ToolPolicy(shell={self.shell!r}, files={self.files}, web={self.web})"
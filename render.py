@@ -0,0 +1,86 @@
+# -- file: render.py --
+# -- libraries --
+import re
+import sys
+import threading
+
+RESET = "\033[0m"
+_ANSI = re.compile(r'\033\[[0-9;]*[A-Za-z]')
+
+class FrameRenderer:
+    """
+    Buffers streamed output and writes it to the terminal in frames instead of once per chunk.
+    Remembers the active color, so the color code is only written when it actually changes.
+    When the stream isnt a TTY, escape codes are dropped and output is written in big batches.
+    """
+
+    def __init__(self, stream=None, fps=30, batch_size=4096):
+        self.stream = stream or sys.stdout
+        self.tty = self.stream.isatty()
+        self.interval = 1 / fps if fps and fps > 0 else 0
+        self.batch_size = batch_size
+        self._buffer = []
+        self._buffered = 0
+        self._color = RESET
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.tty and self.interval:
+            self._thread = threading.Thread(target=self._frame_loop, daemon=True)
+            self._thread.start()
+        return self
+
+    def _frame_loop(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def write(self, text, color=None):
+        """Queues text for the next frame. color is one of the Colors codes, None means the default color."""
+        if not text:
+            return
+        with self._lock:
+            if self.tty:
+                wanted = color or RESET
+                if wanted != self._color:
+                    self._buffer.append(wanted)
+                    self._color = wanted
+            else:
+                text = _ANSI.sub('', text)
+            self._buffer.append(text)
+            self._buffered += len(text)
+
+            # Without a frame thread (not a TTY or fps=0) flush in batches instead
+            if self._thread is None and (self._buffered >= self.batch_size or (self.tty and not self.interval)):
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._buffer:
+            return
+        self.stream.write("".join(self._buffer))
+        self.stream.flush()
+        self._buffer.clear()
+        self._buffered = 0
+
+    def close(self):
+        """Stops the frame thread, restores the default color and writes whatever is left."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            if self.tty and self._color != RESET:
+                self._buffer.append(RESET)
+                self._color = RESET
+            self._flush_locked()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
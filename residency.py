@@ -0,0 +1,86 @@
+# -- file: residency.py --
+# -- libraries --
+from ollama import generate, ps
+import threading
+import time
+
+# Anything that took longer than this to load counts as a cold load
+COLD_LOAD_THRESHOLD = 0.5
+
+class ModelResidency:
+    """
+    Keeps the models ISTA uses loaded on the ollama server.
+    Models get preloaded in the background and every request passes the same
+    keep_alive, so the server doesnt unload them between turns.
+    """
+
+    def __init__(self, keep_alive="30m", caption_keep_alive="1m"):
+        self.keep_alive = keep_alive
+        # The vision model is only needed for a moment, it shouldnt hold memory the chat model needs
+        self.caption_keep_alive = caption_keep_alive
+        self.status = {}       # model -> "loading", "ready" or "failed: ..."
+        self.load_times = {}   # model -> seconds the last cold load took
+        self.cold_loads = {}   # model -> how many cold loads were seen
+        self._lock = threading.Lock()
+
+    def _resident(self):
+        """Names of the models the server has loaded right now."""
+        try:
+            return {m.get('model') or m.get('name') for m in ps().get('models', [])}
+        except Exception:
+            return set()
+
+    def _is_resident(self, name, resident):
+        return name in resident or (":" not in name and f"{name}:latest" in resident)
+
+    def warm(self, *models):
+        """
+        Starts loading the given models in the background. Models already loading or loaded on the server
+        are skipped. Asks the server instead of trusting status, it unloads models once keep_alive runs out.
+        """
+        names = [m for m in dict.fromkeys(models) if m]
+        if not names:
+            return
+        resident = self._resident()
+        for name in names:
+            with self._lock:
+                if self.status.get(name) == "loading" or self._is_resident(name, resident):
+                    continue
+                self.status[name] = "loading"
+            threading.Thread(target=self._load, args=(name,), daemon=True).start()
+
+    def _load(self, name):
+        start = time.perf_counter()
+        try:
+            # An empty prompt only loads the model, nothing gets generated
+            res = generate(model=name, prompt="", keep_alive=self.keep_alive)
+        except Exception as e:
+            with self._lock:
+                self.status[name] = f"failed: {e}"
+            return
+        elapsed = time.perf_counter() - start
+        self.record(name, res, fallback=elapsed)
+        with self._lock:
+            self.status[name] = "ready"
+
+    def record(self, name, stats, fallback=None):
+        """Records load time from a finished ollama response (its load_duration is in nanoseconds)."""
+        load = (stats.get('load_duration') or 0) / 1e9
+        if not load and fallback is not None:
+            load = fallback
+        if load < COLD_LOAD_THRESHOLD:
+            return
+        with self._lock:
+            self.load_times[name] = load
+            self.cold_loads[name] = self.cold_loads.get(name, 0) + 1
+            self.status[name] = "ready"
+
+    def report(self):
+        """Returns a list of (model, status, last cold load seconds, cold load count, resident on server)."""
+        resident = self._resident()
+        with self._lock:
+            names = list(dict.fromkeys(list(self.status) + list(self.load_times)))
+            return [
+                (name, self.status.get(name, "unknown"), self.load_times.get(name), self.cold_loads.get(name, 0), self._is_resident(name, resident))
+                for name in names
+            ]
@@ -0,0 +1,177 @@
+# -- file: sandbox.py --
+# -- libraries --
+import os
+import platform
+import shlex
+import shutil
+import signal
+import subprocess
+import threading
+import time
+
+# ru_maxrss is in kilobytes on Linux but in bytes on macOS
+_RSS_PER_MB = 1024 * 1024 if platform.system() == 'Darwin' else 1024
+
+class ShellPool:
+    """
+    Runs shell commands for the shell tool with resource limits, so a runaway command
+    cant starve the model server on the same machine.
+    - at most max_jobs commands run at the same time, the rest wait
+    - CPU time, address space and open files are limited with ulimit (POSIX only)
+    - commands run at a lower CPU priority (nice) and in the idle IO class (ionice, Linux only)
+    - output over output_bytes kills the command
+    - every command gets its own process group, which is killed afterwards to reap stray children
+    """
+
+    def __init__(self, max_jobs=2, cpu_seconds=60, memory_mb=4096, open_files=256, output_bytes=1024 * 1024, nice=10, timeout=60):
+        self.max_jobs = max_jobs
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.open_files = open_files
+        self.output_bytes = output_bytes
+        self.nice = nice
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_jobs)
+        self._ionice = shutil.which("ionice") if platform.system() == 'Linux' else None
+
+    @classmethod
+    def from_string(cls, spec):
+        """Parses something like "jobs=2,cpu=60,mem=4096,files=256,output=1048576,nice=10,timeout=60"."""
+        names = {"jobs": "max_jobs", "cpu": "cpu_seconds", "mem": "memory_mb", "files": "open_files",
+                 "output": "output_bytes", "nice": "nice", "timeout": "timeout"}
+        options = {}
+        for part in filter(None, (p.strip() for p in spec.split(","))):
+            key, _, value = part.partition("=")
+            if key.strip() not in names:
+                raise ValueError(f"Unknown shell limit: {key}")
+            options[names[key.strip()]] = int(value)
+        return cls(**options)
+
+    def _limit_prefix(self):
+        """
+        Command prefix that applies the limits. No preexec_fn, running Python between fork and
+        exec can deadlock the child when other threads are running (and ISTA has plenty).
+        """
+        prefix = []
+        if self.nice and shutil.which("nice"):
+            prefix += ["nice", "-n", str(self.nice)]
+        if self._ionice:
+            prefix += [self._ionice, "-c", "3"]
+        limits = []
+        if self.cpu_seconds:
+            # Soft limit sends SIGXCPU, the hard limit a few seconds later SIGKILL
+            limits += [f"ulimit -S -t {self.cpu_seconds}", f"ulimit -H -t {self.cpu_seconds + 5}"]
+        if self.memory_mb:
+            limits.append(f"ulimit -v {self.memory_mb * 1024}")
+        if self.open_files:
+            limits.append(f"ulimit -n {self.open_files}")
+        if limits:
+            prefix += ["/bin/sh", "-c", "; ".join(limits) + '; exec "$@"', "sh"]
+        return prefix
+
+    def _start(self, cmd):
+        pipes = dict(stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if platform.system() == 'Windows':
+            # Windows-style command execution, no rlimits here, only a lower priority
+            flags = subprocess.BELOW_NORMAL_PRIORITY_CLASS | subprocess.CREATE_NEW_PROCESS_GROUP
+            return subprocess.Popen(cmd, shell=True, creationflags=flags, **pipes)
+
+        # Unix-style command execution
+        return subprocess.Popen(self._limit_prefix() + shlex.split(cmd), start_new_session=True, **pipes)
+
+    def _kill(self, proc):
+        try:
+            if platform.system() == 'Windows':
+                subprocess.run(["taskkill", "/T", "/F", "/PID", str(proc.pid)], capture_output=True)
+            else:
+                os.killpg(proc.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError, OSError):
+            pass
+
+    def run(self, cmd, inpt="", cancel=None):
+        """
+        Runs cmd and returns a dict with its output, exit code and resource usage.
+        "killed" says why the command was stopped early ("timeout", "output limit", "cpu limit", "canceled") or is None.
+        """
+        with self._slots:
+            return self._run(cmd, inpt, cancel)
+
+    def _run(self, cmd, inpt, cancel):
+        start = time.monotonic()
+        proc = self._start(cmd)
+        chunks = {"stdout": [], "stderr": []}
+        size = [0]
+        over_limit = threading.Event()
+
+        def read(stream, name):
+            for chunk in iter(lambda: stream.read1(65536), b""):
+                if size[0] < self.output_bytes:
+                    chunks[name].append(chunk[:self.output_bytes - size[0]])
+                size[0] += len(chunk)
+                if size[0] > self.output_bytes:
+                    over_limit.set()
+            stream.close()
+
+        def write():
+            try:
+                if inpt:
+                    proc.stdin.write(inpt.encode("utf-8"))
+                proc.stdin.close()
+            except OSError:
+                pass  # the command exited without reading its input
+
+        threads = [
+            threading.Thread(target=read, args=(proc.stdout, "stdout"), daemon=True),
+            threading.Thread(target=read, args=(proc.stderr, "stderr"), daemon=True),
+            threading.Thread(target=write, daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
+
+        killed = None
+        usage = None
+        deadline = start + self.timeout
+        while True:
+            if platform.system() == 'Windows':
+                if proc.poll() is not None:
+                    break
+            else:
+                pid, status, usage = os.wait4(proc.pid, os.WNOHANG)
+                if pid:
+                    proc.returncode = os.waitstatus_to_exitcode(status)
+                    break
+
+            if killed is None:
+                if cancel is not None and cancel.is_set():
+                    killed = "canceled"
+                elif over_limit.is_set():
+                    killed = "output limit"
+                elif time.monotonic() > deadline:
+                    killed = "timeout"
+                if killed:
+                    self._kill(proc)
+            time.sleep(0.02)
+
+        if killed is None and usage and self.cpu_seconds and (
+            proc.returncode == -signal.SIGXCPU
+            or (proc.returncode == -signal.SIGKILL and usage.ru_utime + usage.ru_stime >= self.cpu_seconds)
+        ):
+            killed = "cpu limit"
+
+        # Whatever the command left running in the background goes too
+        self._kill(proc)
+        for thread in threads:
+            thread.join(timeout=1)
+
+        stdout = b"".join(chunks["stdout"]).decode("utf-8", errors="replace")
+        stderr = b"".join(chunks["stderr"]).decode("utf-8", errors="replace")
+        return {
+            "output": (stdout or stderr).strip(),
+            "exit_code": proc.returncode,
+            "killed": killed,
+            "truncated": size[0] > self.output_bytes,
+            "elapsed": round(time.monotonic() - start, 3),
+            "cpu_user": round(usage.ru_utime, 3) if usage else None,
+            "cpu_system": round(usage.ru_stime, 3) if usage else None,
+            "max_rss_mb": round(usage.ru_maxrss / _RSS_PER_MB, 1) if usage else None,
+        }
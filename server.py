@@ -0,0 +1,251 @@
+# -- file: server.py --
+# -- libraries --
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import asyncio
+import json
+import threading
+import time
+import uuid
+
+# Sessions nobody used for this long get dropped
+SESSION_TTL = 60 * 60
+
+class Busy(Exception):
+    """Raised when the model backend queue is full."""
+    pass
+
+class FairScheduler:
+    """
+    Hands out a limited number of model backend slots.
+    Waiting sessions take turns round-robin, so one busy session cant starve the others.
+    """
+
+    def __init__(self, slots=1, max_waiting=16):
+        self.slots = slots
+        self.max_waiting = max_waiting
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = {}      # session id -> deque of tickets
+        self._rotation = deque()  # session ids with waiting tickets, in turn order
+
+    def waiting(self):
+        with self._cond:
+            return sum(len(tickets) for tickets in self._waiting.values())
+
+    def admit(self):
+        """Raises Busy if there is already too much work queued up for the backend."""
+        if self.waiting() >= self.max_waiting:
+            raise Busy(f"{self.max_waiting} requests already waiting for the model.")
+
+    def _next_ticket(self):
+        if not self._rotation:
+            return None
+        return self._waiting[self._rotation[0]][0]
+
+    @contextmanager
+    def slot(self, session_id):
+        ticket = object()
+        with self._cond:
+            tickets = self._waiting.setdefault(session_id, deque())
+            tickets.append(ticket)
+            if session_id not in self._rotation:
+                self._rotation.append(session_id)
+
+            while self._active >= self.slots or self._next_ticket() is not ticket:
+                self._cond.wait()
+
+            tickets.popleft()
+            self._rotation.popleft()
+            if tickets:
+                self._rotation.append(session_id)
+            else:
+                del self._waiting[session_id]
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._cond.notify_all()
+
+class Session:
+    def __init__(self, system_msg, model_name):
+        self.id = uuid.uuid4().hex
+        self.history = [{"role": "system", "content": system_msg}]
+        self.model = model_name
+        self.abort = threading.Event()
+        self.lock = threading.Lock()  # one turn at a time
+        self.last_active = time.time()
+
+class ISTAServer(ThreadingHTTPServer):
+    """
+    Serves ISTA sessions over a local HTTP API. Every session has its own history,
+    model and abort flag, all sessions share one model backend client.
+
+    turn_fn is ISTA.run_turn (or anything with the same signature, for testing).
+    """
+    daemon_threads = True
+
+    def __init__(self, address, turn_fn, tools, system_msg, model_name, client=None, auth=None, slots=1, max_waiting=16):
+        super().__init__(address, RequestHandler)
+        self.turn_fn = turn_fn
+        self.tools = tools
+        self.system_msg = system_msg
+        self.model = model_name
+        self.client = client
+        self.auth = auth
+        self.scheduler = FairScheduler(slots, max_waiting)
+        self.sessions = {}
+        self.sessions_lock = threading.Lock()
+
+    def create_session(self, model_name=None):
+        session = Session(self.system_msg, model_name or self.model)
+        now = time.time()
+        with self.sessions_lock:
+            for session_id in [s.id for s in self.sessions.values() if now - s.last_active > SESSION_TTL and not s.lock.locked()]:
+                del self.sessions[session_id]
+            self.sessions[session.id] = session
+        return session
+
+    def get_session(self, session_id):
+        with self.sessions_lock:
+            return self.sessions.get(session_id)
+
+    def drop_session(self, session_id):
+        with self.sessions_lock:
+            session = self.sessions.pop(session_id, None)
+        if session:
+            session.abort.set()
+        return session is not None
+
+class RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    # -- routes --
+    # POST   /sessions                  -> {"session_id": ...}
+    # GET    /sessions/<id>             -> {"session_id": ..., "model": ..., "history": [...]}
+    # POST   /sessions/<id>/messages    -> streams NDJSON events for one turn
+    # POST   /sessions/<id>/abort       -> stops the running turn
+    # DELETE /sessions/<id>
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length))
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _route(self):
+        parts = [p for p in self.path.split("?")[0].split("/") if p]
+        if not parts or parts[0] != "sessions":
+            return None, None
+        session = self.server.get_session(parts[1]) if len(parts) > 1 else None
+        return parts[1:], session
+
+    def do_POST(self):
+        parts, session = self._route()
+        try:
+            body = self._read_json()
+        except json.JSONDecodeError:
+            return self._send_json(400, {"error": "Body is not valid JSON."})
+        if not isinstance(body, dict):
+            return self._send_json(400, {"error": "Body must be a JSON object."})
+
+        if parts == []:
+            session = self.server.create_session(body.get("model"))
+            return self._send_json(201, {"session_id": session.id, "model": session.model})
+        if parts is None or session is None:
+            return self._send_json(404, {"error": "No such session."})
+        if parts[1:] == ["abort"]:
+            session.abort.set()
+            return self._send_json(200, {"aborted": True})
+        if parts[1:] == ["messages"]:
+            return self._run_turn(session, body)
+        return self._send_json(404, {"error": "Not found."})
+
+    def do_GET(self):
+        parts, session = self._route()
+        if not parts or len(parts) != 1 or session is None:
+            return self._send_json(404, {"error": "No such session."})
+        self._send_json(200, {"session_id": session.id, "model": session.model, "history": session.history})
+
+    def do_DELETE(self):
+        parts, _ = self._route()
+        if not parts or len(parts) != 1 or not self.server.drop_session(parts[0]):
+            return self._send_json(404, {"error": "No such session."})
+        self._send_json(200, {"deleted": True})
+
+    def _run_turn(self, session, body):
+        content = body.get("content", "")
+        if not content or not isinstance(content, str):
+            return self._send_json(400, {"error": "Missing 'content' string."})
+        try:
+            self.server.scheduler.admit()
+        except Busy as e:
+            return self._send_json(503, {"error": str(e)}, {"Retry-After": "5"})
+        if not session.lock.acquire(blocking=False):
+            return self._send_json(409, {"error": "This session is already running a turn."})
+
+        try:
+            session.abort.clear()
+            session.last_active = time.time()
+            session.history.append({"role": "user", "content": content})
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            def send(event):
+                data = (json.dumps(event, default=str) + "\n").encode("utf-8")
+                try:
+                    self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                    self.wfile.flush()
+                except OSError:
+                    # Client went away, no point in generating the rest
+                    session.abort.set()
+
+            try:
+                response = asyncio.run(self.server.turn_fn(
+                    session.history,
+                    self.server.tools,
+                    model_name=session.model,
+                    auth=self.server.auth,
+                    client=self.server.client,
+                    on_event=send,
+                    should_stop=session.abort.is_set,
+                    gate=lambda: self.server.scheduler.slot(session.id)
+                ))
+                send({"type": "done", "content": response})
+            except Exception as e:
+                send({"type": "error", "error": str(e)})
+
+            try:
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+            except OSError:
+                pass
+        finally:
+            session.last_active = time.time()
+            session.lock.release()
+
+def serve(turn_fn, tools, system_msg, model_name, host="127.0.0.1", port=8765, **kwargs):
+    server = ISTAServer((host, port), turn_fn, tools, system_msg, model_name, **kwargs)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
@@ -0,0 +1,89 @@
+# -- file: speculative.py --
+# -- libraries --
+from concurrent.futures import ThreadPoolExecutor
+import json
+import re
+import threading
+
+# Shell commands that only look at things. These are safe to start before the
+# user said yes, if the user says no the result just gets thrown away.
+# No tree (-o and -R -H write files) and no git (fsmonitor, external diff and
+# textconv settings in the repo config can run arbitrary commands).
+READ_ONLY_COMMANDS = {
+    "cat", "dir", "echo", "findstr", "grep", "head", "ls", "pwd", "tail",
+    "type", "wc", "where", "which", "whoami",
+}
+
+# Anything that can chain, redirect or substitute commands disqualifies a command
+_SHELL_OPERATORS = re.compile(r'[;&|<>`$\n]')
+
+def is_read_only_shell(cmd):
+    """True if cmd is a single allowlisted command without redirects or chaining."""
+    if not cmd or _SHELL_OPERATORS.search(cmd) or "--output" in cmd:
+        return False
+    words = cmd.strip().lower().split()
+    if not words:
+        return False
+    return words[0] in READ_ONLY_COMMANDS
+
+def call_key(call):
+    """Identifies a tool call by name + arguments, so the same call can be found again later."""
+    return (call.function['name'], json.dumps(call.function['arguments'], sort_keys=True, default=str))
+
+class SpeculativeRunner:
+    """
+    Starts side-effect-free tool calls while the model is still streaming.
+    process_tool_calls picks the results up with take(), or throws them away with cancel().
+    """
+
+    def __init__(self, max_workers=4):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ista-speculative")
+        self._executors = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, fn, when=None):
+        """
+        fn(args, cancel_event) runs the tool and returns its result.
+        when(args) decides if a specific call is safe to start early, defaults to always.
+        """
+        self._executors[name] = (fn, when)
+
+    def submit(self, call):
+        name = call.function['name']
+        args = call.function['arguments']
+        if name not in self._executors:
+            return
+        fn, when = self._executors[name]
+        if when is not None and not when(args):
+            return
+
+        key = call_key(call)
+        with self._lock:
+            if key in self._pending:
+                return
+            cancel_event = threading.Event()
+            future = self._pool.submit(fn, args, cancel_event)
+            self._pending[key] = (future, cancel_event)
+
+    def take(self, call):
+        """Returns the future of a speculatively started call, or None if it wasnt started."""
+        with self._lock:
+            entry = self._pending.pop(call_key(call), None)
+        return entry[0] if entry else None
+
+    def cancel(self, call):
+        with self._lock:
+            entry = self._pending.pop(call_key(call), None)
+        if entry:
+            future, cancel_event = entry
+            cancel_event.set()
+            future.cancel()
+
+    def cancel_all(self):
+        with self._lock:
+            entries = list(self._pending.values())
+            self._pending.clear()
+        for future, cancel_event in entries:
+            cancel_event.set()
+            future.cancel()
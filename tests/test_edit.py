@@ -0,0 +1,76 @@
+# -- file: tests/test_edit.py --
+# -- libraries --
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from edit import PatchError, apply_patch, apply_patch_text
+
+def block(search, replace):
+    return f"<<<<<<< SEARCH\n{search}=======\n{replace}>>>>>>> REPLACE"
+
+CODE = "def add(a, b):\n    total = a + b\n    return total\n\ndef sub(a, b):\n    return a - b\n"
+
+def test_exact_match():
+    text, removed, added = apply_patch_text(CODE, block("    return a - b\n", "    return b - a\n"))
+    assert text == CODE.replace("a - b", "b - a")
+    assert (removed, added) == (1, 1)
+
+def test_whitespace_match():
+    # Model lost the indentation and added trailing spaces
+    text, _, _ = apply_patch_text(CODE, block("total = a + b   \nreturn total\n", "    return a + b\n"))
+    assert text == "def add(a, b):\n    return a + b\n\ndef sub(a, b):\n    return a - b\n"
+
+def test_fuzzy_match():
+    search = "def add(a, b):\n    totl = a + b\n    return totl\n"
+    text, _, _ = apply_patch_text(CODE, block(search, "def add(a, b):\n    return a + b\n"))
+    assert text.startswith("def add(a, b):\n    return a + b\n\ndef sub")
+
+def test_short_fuzzy_match_is_rejected():
+    text = "def a():\n    return a\n\ndef b():\n    return b\n"
+    with pytest.raises(PatchError):
+        apply_patch_text(text, block("    return c\n", "    return d\n"))
+
+def test_ambiguous_fuzzy_match_is_rejected():
+    text = "".join(f"def f{i}(value):\n    return compute(value, {i})\n\n" for i in range(3))
+    with pytest.raises(PatchError, match="add more context"):
+        apply_patch_text(text, block("def fx(value):\n    return compute(value, 9)\n", "pass\n"))
+
+def test_ambiguous_exact_match_is_rejected():
+    text = "def a():\n    return None\n\ndef b():\n    return None\n"
+    with pytest.raises(PatchError, match="matches 2 places"):
+        apply_patch_text(text, block("    return None\n", "    return 1\n"))
+
+def test_unified_diff_with_header_like_body_lines():
+    text = "for (;;) {\n  x;\n}\n-- comment\nend\n"
+    patch = (
+        "--- a/f.c\n+++ b/f.c\n"
+        "@@ -1,3 +1,4 @@\n for (;;) {\n   x;\n+++i;\n }\n"
+        "@@ -4,2 +5,1 @@\n--- comment\n end\n"
+    )
+    new_text, removed, added = apply_patch_text(text, patch)
+    assert new_text == "for (;;) {\n  x;\n++i;\n}\nend\n"
+    assert (removed, added) == (1, 1)
+
+def test_pure_insertion_hunk():
+    assert apply_patch_text("a\nb\nc\n", "@@ -2,0 +3,1 @@\n+X\n")[0] == "a\nb\nX\nc\n"
+    assert apply_patch_text("a\nb\nc\n", "@@ -0,0 +1,1 @@\n+X\n")[0] == "X\na\nb\nc\n"
+
+def test_crlf_file_keeps_line_endings():
+    text, _, _ = apply_patch_text("one\r\ntwo\r\nthree\r\n", block("two\n", "2\n"))
+    assert text == "one\r\n2\r\nthree\r\n"
+
+def test_only_real_line_breaks_split():
+    assert apply_patch_text("a\x0cb\nc\n", "@@ -1,2 +1,2 @@\n a\x0cb\n-c\n+d\n")[0] == "a\x0cb\nd\n"
+
+def test_failed_patch_leaves_file_untouched(tmp_path):
+    path = tmp_path / "code.py"
+    path.write_bytes(CODE.encode("utf-8"))
+    # First block applies, second doesnt, nothing may be written
+    patch = block("    return total\n", "    return -total\n") + "\n" + block("    return missing_value_here_xyz\n", "pass\n")
+    with pytest.raises(PatchError):
+        apply_patch(str(path), patch)
+    assert path.read_bytes() == CODE.encode("utf-8")
+    assert os.listdir(tmp_path) == ["code.py"]
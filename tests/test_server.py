@@ -0,0 +1,153 @@
+# -- file: tests/test_server.py --
+# -- libraries --
+from http.client import HTTPConnection
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import importlib.util
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from server import ISTAServer
+
+class StubOllama(BaseHTTPRequestHandler):
+    """
+    Answers /api/chat like ollama does when streaming. The first request gets a shell tool call,
+    once the tool result is in the messages it answers with text.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append(body)
+        if self.path != "/api/chat":
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        base = {"model": body["model"], "created_at": "2024-01-01T00:00:00Z"}
+        if body["messages"][-1]["role"] == "tool":
+            chunks = [
+                dict(base, message={"role": "assistant", "content": "The command "}, done=False),
+                dict(base, message={"role": "assistant", "content": "said hi."}, done=False),
+            ]
+        else:
+            call = {"function": {"name": "shell", "arguments": {"command": "echo hi"}}}
+            chunks = [dict(base, message={"role": "assistant", "content": "", "tool_calls": [call]}, done=False)]
+        chunks.append(dict(base, message={"role": "assistant", "content": ""}, done=True, done_reason="stop", prompt_eval_count=12, eval_count=3))
+
+        data = "".join(json.dumps(chunk) + "\n" for chunk in chunks).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def request(port, method, path, body=None):
+    conn = HTTPConnection("127.0.0.1", port, timeout=30)
+    conn.request(method, path, body=body if isinstance(body, (bytes, type(None))) else json.dumps(body))
+    response = conn.getresponse()
+    data = response.read()
+    conn.close()
+    return response.status, data
+
+def start(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_address[1]
+
+@pytest.fixture
+def stub_server():
+    async def turn_fn(history, tools, on_event=None, **kwargs):
+        on_event({"type": "content", "text": "pong"})
+        history.append({"role": "assistant", "content": "pong"})
+        return "pong"
+
+    server = ISTAServer(("127.0.0.1", 0), turn_fn, [], "system", "test-model")
+    yield start(server)
+    server.shutdown()
+    server.server_close()
+
+def test_body_must_be_object(stub_server):
+    status, _ = request(stub_server, "POST", "/sessions", [1])
+    assert status == 400
+    _, data = request(stub_server, "POST", "/sessions", {})
+    session_id = json.loads(data)["session_id"]
+    status, _ = request(stub_server, "POST", f"/sessions/{session_id}/messages", "hi")
+    assert status == 400
+    status, _ = request(stub_server, "POST", f"/sessions/{session_id}/messages", {"content": ["hi"]})
+    assert status == 400
+
+def test_turn_streams_events(stub_server):
+    _, data = request(stub_server, "POST", "/sessions", {})
+    session_id = json.loads(data)["session_id"]
+    status, data = request(stub_server, "POST", f"/sessions/{session_id}/messages", {"content": "ping"})
+    events = [json.loads(line) for line in data.decode("utf-8").splitlines()]
+    assert status == 200
+    assert events == [{"type": "content", "text": "pong"}, {"type": "done", "content": "pong"}]
+
+@pytest.mark.skipif(
+    any(importlib.util.find_spec(name) is None for name in ("ollama", "whisper", "keyboard", "bs4", "numpy")),
+    reason="ISTA.py dependencies not installed"
+)
+def test_run_turn_against_stub_backend():
+    backend = ThreadingHTTPServer(("127.0.0.1", 0), StubOllama)
+    backend.daemon_threads = True
+    backend.requests = []
+    backend_port = start(backend)
+
+    port = free_port()
+    ista = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "ISTA.py"), "--serve", str(port),
+         "--backend", f"http://127.0.0.1:{backend_port}", "--policy", "shell=read-only"],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        # ISTA loads whisper on import, give it a while to come up
+        deadline = time.monotonic() + 300
+        while True:
+            try:
+                status, data = request(port, "POST", "/sessions", {})
+                break
+            except OSError:
+                if ista.poll() is not None or time.monotonic() > deadline:
+                    raise
+                time.sleep(0.5)
+        assert status == 201
+        session_id = json.loads(data)["session_id"]
+
+        status, data = request(port, "POST", f"/sessions/{session_id}/messages", {"content": "say hi"})
+        events = [json.loads(line) for line in data.decode("utf-8").splitlines()]
+        assert status == 200
+        assert [e["type"] for e in events if e["type"] != "content"] == ["tool_call", "tool_result", "done"]
+        assert "hi" in events[[e["type"] for e in events].index("tool_result")]["content"]
+        assert events[-1]["content"] == "The command said hi."
+
+        # Both generations went to the stub, the second one with the tool result in it
+        chats = [r for r in backend.requests if "messages" in r]
+        assert len(chats) == 2
+        assert chats[1]["messages"][-1]["role"] == "tool"
+
+        _, data = request(port, "GET", f"/sessions/{session_id}")
+        roles = [m["role"] for m in json.loads(data)["history"]]
+        assert roles == ["system", "user", "assistant", "tool", "assistant"]
+    finally:
+        ista.kill()
+        ista.wait()
+        backend.shutdown()
+        backend.server_close()
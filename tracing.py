@@ -0,0 +1,92 @@
+# -- file: tracing.py --
+# -- libraries --
+import json
+import os
+import threading
+import time
+
+class _NullSpan:
+    """What span() returns while tracing is off, does nothing."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+    __slots__ = ("tracer", "name", "args", "start")
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer.record(self.name, self.start, time.perf_counter_ns(), **self.args)
+        return False
+
+    def set(self, **args):
+        """Adds args to the span, for things only known once it is running."""
+        self.args.update(args)
+
+class Tracer:
+    """
+    Records nested timing spans and exports them as Chrome trace events
+    (open the file in chrome://tracing, Perfetto or speedscope).
+    Spans are complete ("X") events per thread, the viewer nests them by time.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._events = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def span(self, name, **args):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args)
+
+    def record(self, name, start_ns, end_ns, **args):
+        """Adds a span that was timed by hand (time.perf_counter_ns)."""
+        if not self.enabled:
+            return
+        event = {
+            "name": name,
+            "cat": "ista",
+            "ph": "X",
+            "ts": start_ns / 1000,
+            "dur": (end_ns - start_ns) / 1000,
+            "pid": self._pid,
+            "tid": threading.get_ident(),
+            "args": {key: value if isinstance(value, (int, float, bool)) or value is None else str(value) for key, value in args.items()},
+        }
+        with self._lock:
+            self._events.append(event)
+
+    def export(self, path):
+        with self._lock:
+            events = list(self._events)
+        thread_names = [
+            {"name": "thread_name", "ph": "M", "pid": self._pid, "tid": thread.ident, "args": {"name": thread.name}}
+            for thread in threading.enumerate()
+        ]
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"traceEvents": thread_names + events, "displayTimeUnit": "ms"}, f)
+        return len(events)
+
+tracer = Tracer()
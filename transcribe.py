@@ -0,0 +1,120 @@
+# -- file: transcribe.py --
+# -- libraries --
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import queue
+import threading
+import time
+import whisper
+
+SAMPLE_RATE = whisper.audio.SAMPLE_RATE
+
+def split_on_silence(audio, max_seconds=30, min_seconds=10, frame_ms=30):
+    """
+    Splits audio into (start, end) sample ranges of at most max_seconds (whisper's window).
+    Every cut is placed at the quietest frame between min_seconds and max_seconds, so words dont get cut in half.
+    """
+    frame = SAMPLE_RATE * frame_ms // 1000
+    n_frames = len(audio) // frame
+    if n_frames == 0:
+        return [(0, len(audio))] if len(audio) else []
+
+    energy = np.sqrt(np.mean(np.square(audio[:n_frames * frame].reshape(n_frames, frame)), axis=1))
+    max_frames = max_seconds * 1000 // frame_ms
+    min_frames = min_seconds * 1000 // frame_ms
+
+    spans = []
+    start = 0
+    while n_frames - start > max_frames:
+        window = energy[start + min_frames:start + max_frames]
+        cut = start + min_frames + int(np.argmin(window))
+        spans.append((start * frame, cut * frame))
+        start = cut
+    spans.append((start * frame, len(audio)))
+    return spans
+
+def format_timestamp(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+class ChunkedTranscriber:
+    """
+    Transcribes long audio in silence-separated chunks on a pool of whisper models.
+    Chunks are handed out in order, and once the character or time budget is reached
+    the chunks that didnt start yet are dropped.
+    """
+
+    def __init__(self, model=None, model_name="small", workers=2):
+        self.model_name = model_name
+        self.workers = max(1, workers)
+        # whisper models arent safe to share between threads, so every worker borrows its own
+        self._models = queue.Queue()
+        self._loaded = 0
+        self._lock = threading.Lock()
+        if model is not None:
+            self._models.put(model)
+            self._loaded = 1
+
+    def _borrow_model(self):
+        try:
+            return self._models.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._loaded < self.workers:
+                self._loaded += 1
+                return whisper.load_model(self.model_name)
+        return self._models.get()
+
+    def _transcribe_span(self, audio, start, end):
+        model = self._borrow_model()
+        try:
+            result = model.transcribe(audio[start:end])
+        finally:
+            self._models.put(model)
+        offset = start / SAMPLE_RATE
+        return [
+            {"start": round(offset + s["start"], 2), "end": round(offset + s["end"], 2), "text": s["text"].strip()}
+            for s in result["segments"] if s["text"].strip()
+        ]
+
+    def transcribe(self, file_path, max_chars=2000, time_budget=None, on_segment=None):
+        """
+        Returns {"text", "segments", "truncated", "duration"}. segments keep their start/end in seconds.
+        on_segment(segment) is called for every segment as soon as it is done, in order.
+        """
+        audio = whisper.load_audio(file_path)
+        spans = deque(split_on_silence(audio))
+        started = time.monotonic()
+        segments = []
+        chars = 0
+        truncated = False
+
+        pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ista-whisper")
+        pending = deque()
+        try:
+            while spans and len(pending) < self.workers:
+                pending.append(pool.submit(self._transcribe_span, audio, *spans.popleft()))
+
+            while pending:
+                for segment in pending.popleft().result():
+                    segments.append(segment)
+                    chars += len(segment["text"]) + 1
+                    if on_segment is not None:
+                        on_segment(segment)
+
+                over_time = time_budget is not None and time.monotonic() - started > time_budget
+                if chars >= max_chars or over_time:
+                    truncated = bool(spans or pending)
+                    break
+                if spans:
+                    pending.append(pool.submit(self._transcribe_span, audio, *spans.popleft()))
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        text = " ".join(segment["text"] for segment in segments)
+        if len(text) > max_chars:
+            text = text[:max_chars]
+            truncated = True
+        return {"text": text, "segments": segments, "truncated": truncated, "duration": len(audio) / SAMPLE_RATE}
@@ -0,0 +1,78 @@
+# -- file: vision.py --
+# -- libraries --
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+import hashlib
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional, images are sent as they are without it
+    Image = None
+
+# Native input size of the gemma3 vision encoder, anything bigger just gets scaled down by the server
+IMAGE_SIZE = 896
+
+def preprocess_image(path, max_side=IMAGE_SIZE):
+    """
+    Returns (image, digest). image is a downscaled JPEG as bytes, ready to send to the model,
+    digest is its sha256. Without Pillow the path itself comes back and digest is None.
+    """
+    if Image is None:
+        return path, None
+
+    with Image.open(path) as img:
+        img.seek(0)  # first frame of animated gifs/webps
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+
+        # Transparent parts would turn black in a JPEG, put them on white instead
+        if img.mode in ("RGBA", "LA", "P"):
+            img = img.convert("RGBA")
+            background = Image.new("RGB", img.size, (255, 255, 255))
+            background.paste(img, mask=img.getchannel("A"))
+            img = background
+
+        buffer = BytesIO()
+        img.convert("RGB").save(buffer, format="JPEG", quality=90)
+    image = buffer.getvalue()
+    return image, hashlib.sha256(image).hexdigest()
+
+def describe_images(paths, describe, concurrency=2, max_side=IMAGE_SIZE):
+    """
+    Describes several images at once. Every image is downscaled first, exact duplicates (same pixels
+    after downscaling) are only described once and up to concurrency requests run at the same time.
+    Similar looking images still get their own description, a perceptual hash matched too many
+    screenshots of the same app. describe(image) gets the preprocessed image and returns its description.
+    Returns {path: description}, duplicates say which image they are the same as.
+    """
+    def prepare(path):
+        try:
+            return preprocess_image(path, max_side)
+        except Exception:
+            return path, None  # let the model server deal with formats Pillow doesnt know
+
+    def run(image):
+        try:
+            return describe(image)
+        except Exception as e:
+            return f"Could not describe image: {e}"
+
+    paths = list(dict.fromkeys(paths))
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="ista-vision") as pool:
+        prepared = list(pool.map(prepare, paths))
+
+        unique = {}     # digest (or path without one) -> (path, image) that actually get described
+        same_as = {}    # path -> path of the image it duplicates
+        for path, (image, digest) in zip(paths, prepared):
+            key = digest or path
+            if key in unique:
+                same_as[path] = unique[key][0]
+            else:
+                unique[key] = (path, image)
+        del prepared
+
+        descriptions = dict(zip((path for path, _ in unique.values()), pool.map(run, [image for _, image in unique.values()])))
+
+    for path, original in same_as.items():
+        descriptions[path] = f"Same image as {original}: {descriptions[original]}"
+    return descriptions
@@ -8,8 +8,13 @@ from requests.exceptions import RequestException
 from youtube_transcript_api import YouTubeTranscriptApi, TranscriptsDisabled, NoTranscriptFound
 from urllib.parse import urlparse, parse_qs
 from tqdm import tqdm
+from tracing import tracer
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from collections import deque
 import json
 import os
+import threading
+import time
 import warnings
 
 # Filter XML parsing warning
@@ -18,6 +23,126 @@ warnings.filterwarnings("ignore", category=XMLParsedAsHTMLWarning)
 google_api_key = os.getenv("GOOGLE_KEY")
 google_cx = os.getenv("GOOGLE_CX")
 
+# -- fetch layer --
+MIN_TIMEOUT = 2          # seconds, adaptive timeouts never go below this...
+MAX_TIMEOUT = 10         # ...or above this (the old fixed timeout)
+DEFAULT_HEDGE_DELAY = 3  # seconds before hedging a host we know nothing about yet
+BREAKER_FAILURES = 3     # failures in a row before a host gets skipped
+BREAKER_COOLDOWN = 60    # seconds a failing host gets skipped for
+SEARCH_DEADLINE = 15     # seconds for crawling all search results together, slower sites are left out
+
+class HostUnavailable(RequestException):
+    """Raised instead of fetching when a host's circuit breaker is open."""
+    pass
+
+class HostHealth:
+    """Recent latencies and the circuit breaker of one host."""
+
+    def __init__(self):
+        self.latencies = deque(maxlen=50)
+        self.failures = 0
+        self.open_until = 0
+        self.lock = threading.Lock()
+
+    def _percentile(self, p):
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+    def timeout(self):
+        """A few times the slow end of what this host usually takes, within MIN/MAX_TIMEOUT."""
+        with self.lock:
+            if len(self.latencies) < 5:
+                return MAX_TIMEOUT
+            return max(MIN_TIMEOUT, min(MAX_TIMEOUT, self._percentile(0.95) * 4))
+
+    def hedge_delay(self):
+        """How long to wait before sending a second request, this hosts p95 latency."""
+        with self.lock:
+            if len(self.latencies) < 5:
+                return DEFAULT_HEDGE_DELAY
+            return self._percentile(0.95)
+
+    def is_open(self):
+        with self.lock:
+            return time.monotonic() < self.open_until
+
+    def success(self, latency):
+        with self.lock:
+            self.latencies.append(latency)
+            self.failures = 0
+
+    def failure(self, timed_out=False):
+        """A host that didnt answer within its timeout is skipped right away, the next page would just time out too."""
+        with self.lock:
+            self.failures += 1
+            if timed_out or self.failures >= BREAKER_FAILURES:
+                self.open_until = time.monotonic() + BREAKER_COOLDOWN
+
+_hosts = {}
+_hosts_lock = threading.Lock()
+_fetch_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="ista-fetch")
+
+def host_health(url):
+    host = urlparse(url).netloc.lower()
+    with _hosts_lock:
+        if host not in _hosts:
+            _hosts[host] = HostHealth()
+        return _hosts[host]
+
+def fetch(url, headers=None, alternate=None):
+    """
+    requests.get with tail latency controls:
+    - the timeout adapts to how fast the host usually answers
+    - if the host takes longer than its p95, a second (hedged) request goes out to alternate
+      (or the same url again) and whichever answers first wins
+    - both requests together never take longer than the timeout, and one fetch counts as one failure at most
+    - hosts that keep failing or time out are skipped for BREAKER_COOLDOWN seconds (raises HostUnavailable)
+    """
+    health = host_health(url)
+    if health.is_open():
+        raise HostUnavailable(f"Skipping {urlparse(url).netloc}, it failed or timed out recently.")
+
+    timeout = health.timeout()
+    started = time.monotonic()
+    deadline = started + timeout
+    pending = {_fetch_pool.submit(requests.get, url, timeout=timeout, headers=headers)}
+    done, pending = wait(pending, timeout=min(health.hedge_delay(), timeout))
+    remaining = deadline - time.monotonic()
+    hedge = None
+    if not done and remaining > 0:
+        hedge_started = time.perf_counter_ns()
+        hedge = _fetch_pool.submit(requests.get, alternate or url, timeout=remaining, headers=headers)
+        pending.add(hedge)
+
+    error = None
+    response = None
+    while response is None:
+        for future in done:
+            try:
+                response = future.result()
+                break
+            except RequestException as e:
+                error = error or e
+        remaining = deadline - time.monotonic()
+        if response is not None or not pending or remaining <= 0:
+            break
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+
+    if hedge is not None:
+        tracer.record("fetch.hedge", hedge_started, time.perf_counter_ns(), url=alternate or url,
+                      won=response is not None and hedge.done() and not hedge.exception() and hedge.result() is response)
+
+    if response is None:
+        # Whatever is still running gets ignored, its result doesnt count either way
+        health.failure(timed_out=error is None or isinstance(error, requests.exceptions.Timeout))
+        raise error or requests.exceptions.Timeout(f"No response from {urlparse(url).netloc} within {timeout:.1f}s.")
+    if response.status_code >= 500:
+        health.failure()
+    else:
+        # What the caller waited, not how long the winning request took on its own
+        health.success(time.monotonic() - started)
+    return response
+
 def get_youtube_captions(url):
     try:
         query = urlparse(url).query
@@ -52,6 +177,10 @@ class AdvCrawler:
 
     def crawl(self):
         """Main crawl method that respects robots.txt rules."""
+        with tracer.span("crawl", url=self.url):
+            return self._crawl()
+
+    def _crawl(self):
         try:
             # Specialized handling for known platforms
             if "youtube.com" in self.url or "youtu.be" in self.url:
@@ -83,7 +212,7 @@ class AdvCrawler:
         return {"User-Agent": self.user_agent}  # Use instance attribute
 
     def _crawl_general(self):
-        response = requests.get(self.url, timeout=10, headers=self._get_headers())
+        response = fetch(self.url, headers=self._get_headers())
 
         if response.status_code != 200:
             return {"error": f"Failed to retrieve the content, status code: {response.status_code}"}
@@ -111,26 +240,12 @@ class AdvCrawler:
         # Take up to 3 internal links
         selected_links = internal_links[:3]
 
-        clicked_pages = []
-
-        for link in selected_links:
-            try:
-                sub_response = requests.get(link, timeout=10, headers=self._get_headers())
-                if sub_response.status_code != 200:
-                    continue
-
-                sub_soup = BeautifulSoup(sub_response.content, "html.parser")
-                sub_title = sub_soup.title.string.strip() if sub_soup.title else "No title found"
-                sub_description_tag = sub_soup.find("meta", attrs={"name": "description"})
-                sub_description = sub_description_tag["content"].strip() if sub_description_tag else "No description available"
-
-                clicked_pages.append({
-                    "link": link,
-                    "title": sub_title,
-                    "description": sub_description
-                })
-            except Exception as e:
-                continue  # skip any errors in subpage fetching
+        # All subpages at once, together they get as long as one page of this host
+        pool = ThreadPoolExecutor(max_workers=max(1, len(selected_links)), thread_name_prefix="ista-subpage")
+        futures = [pool.submit(self._crawl_subpage, link) for link in selected_links]
+        wait(futures, timeout=host_health(self.url).timeout())
+        pool.shutdown(wait=False, cancel_futures=True)
+        clicked_pages = [f.result() for f in futures if f.done() and not f.cancelled() and f.result()]
 
         # Extract and limit site content to 100 words
         paragraphs = soup.find_all("p")
@@ -146,8 +261,28 @@ class AdvCrawler:
             "clicked_pages": clicked_pages  # <-- Add clicked pages info here
         }
 
+    def _crawl_subpage(self, link):
+        try:
+            with tracer.span("crawl.subpage", url=link):
+                sub_response = fetch(link, headers=self._get_headers())
+            if sub_response.status_code != 200:
+                return None
+
+            sub_soup = BeautifulSoup(sub_response.content, "html.parser")
+            sub_title = sub_soup.title.string.strip() if sub_soup.title else "No title found"
+            sub_description_tag = sub_soup.find("meta", attrs={"name": "description"})
+            sub_description = sub_description_tag["content"].strip() if sub_description_tag else "No description available"
+
+            return {
+                "link": link,
+                "title": sub_title,
+                "description": sub_description
+            }
+        except Exception as e:
+            return None  # skip any errors in subpage fetching
+
     def _crawl_youtube(self):
-        response = requests.get(self.url, timeout=10)
+        response = fetch(self.url)
         
         if response.status_code != 200:
             return {"error": f"Failed to retrieve the YouTube page, status code: {response.status_code}"}
@@ -204,7 +339,7 @@ class AdvCrawler:
         }
 
     def _crawl_twitter(self):
-        response = requests.get(self.url, timeout=10)
+        response = fetch(self.url)
 
         if response.status_code != 200:
             return "Failed to retrieve the Twitter page, status code: {}".format(response.status_code)
@@ -224,7 +359,7 @@ class AdvCrawler:
         }
 
     def _crawl_medium(self):
-        response = requests.get(self.url, timeout=10)
+        response = fetch(self.url)
 
         if response.status_code != 200:
             return "Failed to retrieve the Medium page, status code: {}".format(response.status_code)
@@ -244,7 +379,7 @@ class AdvCrawler:
         }
     
     def _crawl_github(self):
-        response = requests.get(self.url, timeout=10)
+        response = fetch(self.url)
         if response.status_code != 200:
             return "Failed to retrieve the GitHub page, status code: {}".format(response.status_code)
 
@@ -261,7 +396,7 @@ class AdvCrawler:
         }
 
     def _crawl_stackoverflow(self):
-        response = requests.get(self.url, timeout=10)
+        response = fetch(self.url)
         if response.status_code != 200:
             return "Failed to retrieve the Stack Overflow page, status code: {}".format(response.status_code)
 
@@ -278,7 +413,7 @@ class AdvCrawler:
         }
 
     def _crawl_hackernews(self):
-        response = requests.get(self.url, timeout=10)
+        response = fetch(self.url)
         if response.status_code != 200:
             return "Failed to retrieve the Hacker News page, status code: {}".format(response.status_code)
 
@@ -293,7 +428,7 @@ class AdvCrawler:
         }
 
     def _crawl_devto(self):
-        response = requests.get(self.url, timeout=10)
+        response = fetch(self.url)
         if response.status_code != 200:
             return "Failed to retrieve the Dev.to page, status code: {}".format(response.status_code)
 
@@ -311,7 +446,7 @@ class AdvCrawler:
 
     def _crawl_steam(self):
         headers = self._get_headers()
-        response = requests.get(self.url, timeout=10, headers=headers)
+        response = fetch(self.url, headers=headers)
         if response.status_code != 200:
             return f"Failed to retrieve the Steam page, status code: {response.status_code}"
 
@@ -331,8 +466,12 @@ class AdvCrawler:
             "publisher": publisher
         }
 
-async def web_search(tool_input: str, num_sites: int) -> str:
+async def web_search(tool_input: str, num_sites: int, progress: bool = True) -> str:
     """Perform a web search and return the top results with links. Retries up to 3 times if no results."""
+    with tracer.span("web_search", query=tool_input, num_sites=num_sites):
+        return await _web_search(tool_input, num_sites, progress)
+
+async def _web_search(tool_input, num_sites, progress):
     search_results = []
 
     try:
@@ -340,7 +479,7 @@ async def web_search(tool_input: str, num_sites: int) -> str:
 
         if 'http://' in tool_input or 'https://' in tool_input:
             # Directly crawl a provided URL
-            with tqdm(total=1, desc="Crawling URL", unit="site", 
+            with tqdm(total=1, desc="Crawling URL", unit="site", disable=not progress,
                      bar_format="\033[94m{desc}\033[0m: {percentage:3.0f}%|"
                      "\033[92m{bar}\033[0m| {n_fmt}/{total_fmt} [{elapsed}<{remaining}]") as pbar:
                 crawler = AdvCrawler(tool_input)
@@ -357,26 +496,33 @@ async def web_search(tool_input: str, num_sites: int) -> str:
                     f"&cx={google_cx}"
                 )
 
-                response = requests.get(search_url)
+                with tracer.span("google_search", attempt=attempt + 1):
+                    response = requests.get(search_url)
                 response.raise_for_status()
 
                 response_json = response.json()
                 items = response_json.get("items", [])
 
                 if items:
-                    with tqdm(total=min(num_sites, len(items)), desc="Crawling search results", unit="site",
+                    with tqdm(total=min(num_sites, len(items)), desc="Crawling search results", unit="site", disable=not progress,
                             bar_format="\033[94m{desc}\033[0m: {percentage:3.0f}%|"
                             "\033[92m{bar}\033[0m| {n_fmt}/{total_fmt} [{elapsed}<{remaining}]") as pbar:
-                        for item in items[:num_sites]:
-                            link = item.get("link")
-                            crawler = AdvCrawler(link)
+                        # Every site at once under one deadline, so the slowest site doesnt set the search latency
+                        items = items[:num_sites]
+                        pool = ThreadPoolExecutor(max_workers=max(1, len(items)), thread_name_prefix="ista-crawl")
+                        futures = [pool.submit(AdvCrawler(item.get("link")).crawl) for item in items]
+                        for future in futures:
+                            future.add_done_callback(lambda _: pbar.update(1))
+                        wait(futures, timeout=SEARCH_DEADLINE)
+                        pool.shutdown(wait=False, cancel_futures=True)
+
+                        for item, future in zip(items, futures):
                             search_results.append({
                                 "title": item.get("title"),
-                                "link": link,
+                                "link": item.get("link"),
                                 "snippet": item.get("snippet"),
-                                "scraped_content": crawler.crawl()
+                                "scraped_content": future.result() if future.done() else {"error": f"Site took longer than {SEARCH_DEADLINE}s, skipped."}
                             })
-                            pbar.update(1)
                     break
                 else:
                     print(f"No results found, attempt {attempt + 1} of {max_retries}...")